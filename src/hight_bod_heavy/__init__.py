@@ -1,9 +1,21 @@
 from .hight_bod_heavy import CalculadoraIMC
 from .hight_bod_heavy import CalculadoraGrasaCorporal
 from .hight_bod_heavy import CalculadoraMasaMuscular
+from .agregacion import MotorAgrupacion
+from .resumenes import ResumenCuantiles, HistogramaFijo, ResumenesPoblacion
+from .eventos import EventoTransicion, DetectorTransiciones
+from .replicas import PublicadorMemoria, ReplicaLectura
 
 __all__ = [
     'CalculadoraIMC',
     'CalculadoraGrasaCorporal', 
-    'CalculadoraMasaMuscular'
+    'CalculadoraMasaMuscular',
+    'MotorAgrupacion',
+    'ResumenCuantiles',
+    'HistogramaFijo',
+    'ResumenesPoblacion',
+    'EventoTransicion',
+    'DetectorTransiciones',
+    'PublicadorMemoria',
+    'ReplicaLectura'
 ]
\ No newline at end of file
@@ -0,0 +1,284 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .resumenes import HistogramaFijo
+
+
+def _clave_decada(edad) -> int:
+    return (int(edad) // 10) * 10
+
+
+def _clave_sexo(sexo) -> str:
+    return sexo.upper()
+
+
+def _clave_mes(fecha) -> str:
+    return fecha.strftime('%Y-%m')
+
+
+# Claves predefinidas: nombre -> (columnas que usa, función de agrupación). Los
+# clasificadores de las calculadoras se indican como 'Clase.metodo' y se resuelven
+# una vez por agrupación (importarlos aquí sería circular)
+CLAVES_PREDEFINIDAS = {
+    'decada': (('edad',), _clave_decada),
+    'sexo': (('sexo',), _clave_sexo),
+    'categoria_imc': (('imc',), 'CalculadoraIMC.clasificar'),
+    'categoria_grasa': (('porcentaje_grasa', 'sexo', 'edad'), 'CalculadoraGrasaCorporal.clasificar_grasa'),
+    'mes': (('fecha',), _clave_mes),
+}
+
+AGREGADOS_VALIDOS = ('conteo', 'media', 'desviacion', 'minimo', 'maximo', 'histograma')
+
+ClaveAgrupacion = Union[str, Tuple[Sequence[str], Callable]]
+
+
+def _resolver_clave(clave: ClaveAgrupacion) -> Tuple[Tuple[str, ...], Optional[Callable]]:
+    """Convierte una clave en (columnas, función). Sin función se usa el valor tal cual"""
+    if isinstance(clave, str):
+        if clave in CLAVES_PREDEFINIDAS:
+            columnas, funcion = CLAVES_PREDEFINIDAS[clave]
+            if isinstance(funcion, str):
+                from . import hight_bod_heavy
+                clase, metodo = funcion.split('.')
+                funcion = getattr(getattr(hight_bod_heavy, clase), metodo)
+            return columnas, funcion
+        return (clave,), None
+    columnas, funcion = clave
+    if isinstance(columnas, str):
+        columnas = (columnas,)
+    return tuple(columnas), funcion
+
+
+def _percentil_de_agregado(agregado: str) -> Optional[float]:
+    """Devuelve q en [0, 100] para agregados de la forma 'p95' o 'p99.9'"""
+    if not agregado.startswith('p'):
+        return None
+    try:
+        q = float(agregado[1:])
+    except ValueError:
+        return None
+    if q < 0 or q > 100:
+        raise ValueError("El percentil debe estar entre 0 y 100")
+    return q
+
+
+def percentil(valores_ordenados: Sequence[float], q: float) -> float:
+    """Percentil q (0-100) con interpolación lineal sobre valores ya ordenados"""
+    if not valores_ordenados:
+        raise ValueError("No hay valores para calcular el percentil")
+    posicion = (len(valores_ordenados) - 1) * q / 100
+    inferior = math.floor(posicion)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    fraccion = posicion - inferior
+    return valores_ordenados[inferior] + (valores_ordenados[superior] - valores_ordenados[inferior]) * fraccion
+
+
+def normalizar_claves(claves) -> List[ClaveAgrupacion]:
+    """Acepta una clave suelta o una lista de claves y retorna siempre una lista"""
+    if isinstance(claves, str) or (isinstance(claves, tuple) and callable(claves[-1])):
+        return [claves]
+    return list(claves)
+
+
+def columnas_requeridas(claves, valor: str) -> List[str]:
+    """Columnas que necesita una agrupación (para no construir las demás)"""
+    nombres = []
+    for clave in normalizar_claves(claves):
+        for nombre in _resolver_clave(clave)[0]:
+            if nombre not in nombres:
+                nombres.append(nombre)
+    if valor not in nombres:
+        nombres.append(valor)
+    return nombres
+
+
+def _claves_por_fila(columnas: Dict[str, Sequence], claves: List[Tuple[Tuple[str, ...], Optional[Callable]]]):
+    """Iterable con la clave de grupo de cada fila (claves ya resueltas)"""
+    iterables = []
+    for nombres, funcion in claves:
+        datos = [columnas[nombre] for nombre in nombres]
+        iterables.append(datos[0] if funcion is None else map(funcion, *datos))
+    return iterables[0] if len(iterables) == 1 else zip(*iterables)
+
+
+def _agregar_parcial(columnas: Dict[str, Sequence], claves: List[Tuple[Tuple[str, ...], Optional[Callable]]],
+                     valor: str, necesita_m2: bool, guardar_valores: bool,
+                     bins: Optional[Tuple[float, float, int]]) -> Dict:
+    """Recorre una vez las columnas y devuelve el estado parcial por grupo.
+
+    Estado por grupo: [conteo, media, m2, minimo, maximo, valores, histograma].
+    Solo se guardan los valores si se piden percentiles; m2 (Welford) solo si se
+    pide la desviación.
+    """
+    for nombres, _ in claves:
+        for nombre in nombres + (valor,):
+            if nombre not in columnas:
+                raise ValueError(f"Columna no disponible: '{nombre}'")
+
+    grupos = {}
+    filas = zip(_claves_por_fila(columnas, claves), columnas[valor])
+    if not (necesita_m2 or guardar_valores or bins is not None):
+        # Conteo, media y extremos: basta con la suma y la media se obtiene al final
+        for clave, x in filas:
+            estado = grupos.get(clave)
+            if estado is None:
+                estado = grupos[clave] = [0, 0.0, 0.0, x, x, None, None]
+            estado[0] += 1
+            estado[1] += x
+            if x < estado[3]:
+                estado[3] = x
+            elif x > estado[4]:
+                estado[4] = x
+        for estado in grupos.values():
+            estado[1] /= estado[0]
+        return grupos
+
+    for clave, x in filas:
+        estado = grupos.get(clave)
+        if estado is None:
+            estado = grupos[clave] = [0, 0.0, 0.0, x, x, array('d') if guardar_valores else None,
+                                      HistogramaFijo(*bins) if bins is not None else None]
+        n = estado[0] + 1
+        delta = x - estado[1]
+        estado[0] = n
+        estado[1] += delta / n
+        estado[2] += delta * (x - estado[1])
+        if x < estado[3]:
+            estado[3] = x
+        elif x > estado[4]:
+            estado[4] = x
+        if guardar_valores:
+            estado[5].append(x)
+        if bins is not None:
+            estado[6].agregar(x)
+    return grupos
+
+
+def _combinar_estados(a: List, b: List) -> List:
+    """Combina dos estados parciales de un mismo grupo (fórmula de Chan)"""
+    n = a[0] + b[0]
+    delta = b[1] - a[1]
+    media = a[1] + delta * b[0] / n
+    m2 = a[2] + b[2] + delta * delta * a[0] * b[0] / n
+    valores = a[5] + b[5] if a[5] is not None else None
+    if a[6] is not None:
+        a[6].combinar(b[6])
+    return [n, media, m2, min(a[3], b[3]), max(a[4], b[4]), valores, a[6]]
+
+
+def combinar_parciales(parciales: List[Dict]) -> Dict:
+    """Combina los estados parciales calculados sobre distintos bloques"""
+    resultado = {}
+    for parcial in parciales:
+        for clave, estado in parcial.items():
+            if clave in resultado:
+                resultado[clave] = _combinar_estados(resultado[clave], estado)
+            else:
+                resultado[clave] = estado
+    return resultado
+
+
+class MotorAgrupacion:
+    """Motor de agrupación de una sola pasada sobre datos en columnas"""
+
+    def __init__(self, columnas: Dict[str, Sequence]):
+        longitudes = {len(columna) for columna in columnas.values()}
+        if len(longitudes) > 1:
+            raise ValueError("Todas las columnas deben tener la misma longitud")
+        self.columnas = columnas
+        self.total_filas = longitudes.pop() if longitudes else 0
+
+    def agrupar(self, claves: Union[ClaveAgrupacion, List[ClaveAgrupacion]], valor: str,
+                agregados: Sequence[str] = ('conteo', 'media'),
+                bins: Optional[Tuple[float, float, int]] = None,
+                procesos: int = 1, tamano_bloque: int = 100000) -> Dict:
+        """Agrupa por una o varias claves y calcula los agregados de la columna `valor`.
+
+        Claves: nombre predefinido ('decada', 'sexo', 'categoria_imc', 'categoria_grasa',
+        'mes'), nombre de columna, o tupla (columnas, función).
+        Agregados: 'conteo', 'media', 'desviacion', 'minimo', 'maximo', 'histograma'
+        (requiere bins=(inicio, fin, cantidad); igual que HistogramaFijo, los valores
+        fuera de rango se cuentan en por_debajo/por_encima) y percentiles como 'p5', 'p95'.
+        Con procesos > 1 los bloques se agregan en paralelo y luego se combinan; las
+        funciones de clave propias deben poder serializarse (definidas a nivel de módulo).
+        """
+        claves = normalizar_claves(claves)
+        if not claves:
+            raise ValueError("Debe indicar al menos una clave de agrupación")
+
+        percentiles = {}
+        for agregado in agregados:
+            q = _percentil_de_agregado(agregado)
+            if q is not None:
+                percentiles[agregado] = q
+            elif agregado not in AGREGADOS_VALIDOS:
+                raise ValueError(f"Agregado no válido: '{agregado}'")
+        if 'histograma' in agregados:
+            if bins is None:
+                raise ValueError("El histograma requiere bins=(inicio, fin, cantidad)")
+            if bins[2] <= 0 or bins[1] <= bins[0]:
+                raise ValueError("Bins no válidos")
+        else:
+            bins = None
+        guardar_valores = bool(percentiles)
+        necesita_m2 = 'desviacion' in agregados
+        resueltas = [_resolver_clave(clave) for clave in claves]
+        opciones = (necesita_m2, guardar_valores, bins)
+
+        if procesos > 1 and self.total_filas > tamano_bloque:
+            # Solo se envían a los procesos las columnas que usa la consulta
+            nombres = [n for n in columnas_requeridas(claves, valor) if n in self.columnas]
+            bloques = []
+            for inicio in range(0, self.total_filas, tamano_bloque):
+                fin = inicio + tamano_bloque
+                bloques.append({nombre: self.columnas[nombre][inicio:fin] for nombre in nombres})
+            with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+                futuros = [ejecutor.submit(_agregar_parcial, bloque, resueltas, valor, *opciones)
+                           for bloque in bloques]
+                grupos = combinar_parciales([futuro.result() for futuro in futuros])
+        else:
+            grupos = _agregar_parcial(self.columnas, resueltas, valor, *opciones)
+
+        resultado = {}
+        for clave, estado in grupos.items():
+            n, media, m2, minimo, maximo, valores, histograma = estado
+            fila = {}
+            if valores is not None:
+                valores = sorted(valores)
+            for agregado in agregados:
+                if agregado == 'conteo':
+                    fila['conteo'] = n
+                elif agregado == 'media':
+                    fila['media'] = media
+                elif agregado == 'desviacion':
+                    fila['desviacion'] = math.sqrt(m2 / (n - 1)) if n > 1 else 0
+                elif agregado == 'minimo':
+                    fila['minimo'] = minimo
+                elif agregado == 'maximo':
+                    fila['maximo'] = maximo
+                elif agregado == 'histograma':
+                    fila['histograma'] = histograma.a_dict()
+                else:
+                    fila[agregado] = percentil(valores, percentiles[agregado])
+            resultado[clave] = fila
+        return resultado
+
+
+def columnas_desde_registros(registros: List[Dict], tipos: Dict[str, Optional[str]],
+                             nombres: Optional[Sequence[str]] = None) -> Dict[str, Sequence]:
+    """Convierte una lista de registros en columnas.
+
+    `tipos` asocia cada columna a un código de `array` ('d', 'q', ...) o a None
+    para guardarla como lista (textos, fechas). Con `nombres` solo se construyen
+    esas columnas.
+    """
+    columnas = {}
+    for nombre in (tipos if nombres is None else nombres):
+        if nombre not in tipos:
+            continue
+        tipo = tipos[nombre]
+        valores = [registro[nombre] for registro in registros]
+        columnas[nombre] = array(tipo, valores) if tipo else valores
+    return columnas
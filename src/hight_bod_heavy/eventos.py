@@ -0,0 +1,107 @@
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+import queue
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EventoTransicion:
+    """Cambio de clasificación entre dos registros consecutivos"""
+    categoria: str  # 'imc' o 'grasa'
+    anterior: str
+    nueva: str
+    fecha: datetime
+    registro: Dict
+
+
+class DetectorTransiciones:
+    """Detecta en O(1) por registro los cambios de clasificación y los notifica.
+
+    Antirrebote: con `confirmaciones` > 1 la nueva clasificación debe repetirse en
+    esa cantidad de registros seguidos antes de emitir el evento; con
+    `intervalo_minimo` no se emiten dos eventos más cerca que ese intervalo (el
+    cambio queda pendiente y se emite en el siguiente registro fuera del intervalo).
+    Un suscriptor que falla no interrumpe la ingesta: el error se registra en el log
+    y se guarda en `errores` (los últimos `MAXIMO_ERRORES`).
+    """
+
+    MAXIMO_ERRORES = 100
+
+    def __init__(self, categoria: str, confirmaciones: int = 1, intervalo_minimo: Optional[timedelta] = None):
+        if confirmaciones < 1:
+            raise ValueError("Las confirmaciones deben ser al menos 1")
+        self.categoria = categoria
+        self.confirmaciones = confirmaciones
+        self.intervalo_minimo = intervalo_minimo
+        self.suscriptores: List[Callable[[EventoTransicion], None]] = []
+        self.errores = deque(maxlen=self.MAXIMO_ERRORES)  # (evento, excepción)
+        self.reiniciar()
+
+    def reiniciar(self, clasificacion: Optional[str] = None):
+        """Olvida el estado previo; `clasificacion` pasa a ser la actual (sin evento)"""
+        self.actual = clasificacion
+        self._candidata = None
+        self._repeticiones = 0
+        self._ultimo_evento = None
+
+    def suscribir(self, callback: Callable[[EventoTransicion], None]) -> Callable[[EventoTransicion], None]:
+        """Registra una función que recibe cada EventoTransicion"""
+        self.suscriptores.append(callback)
+        return callback
+
+    def desuscribir(self, callback: Callable[[EventoTransicion], None]):
+        self.suscriptores.remove(callback)
+
+    def crear_cola(self, maximo: int = 0) -> queue.Queue:
+        """Retorna una cola (thread-safe) que recibe los eventos; si está llena se descartan"""
+        cola = queue.Queue(maximo)
+
+        def encolar(evento: EventoTransicion):
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                pass
+
+        self.suscribir(encolar)
+        return cola
+
+    def observar(self, clasificacion: str, registro: Dict) -> Optional[EventoTransicion]:
+        """Compara la clasificación nueva con la anterior y emite el evento si corresponde"""
+        if self.actual is None:
+            self.actual = clasificacion
+            return None
+        if clasificacion == self.actual:
+            self._candidata = None
+            self._repeticiones = 0
+            return None
+
+        if clasificacion == self._candidata:
+            self._repeticiones += 1
+        else:
+            self._candidata = clasificacion
+            self._repeticiones = 1
+        if self._repeticiones < self.confirmaciones:
+            return None
+
+        fecha = registro['fecha']
+        if (self.intervalo_minimo is not None and self._ultimo_evento is not None
+                and fecha - self._ultimo_evento < self.intervalo_minimo):
+            return None
+
+        evento = EventoTransicion(self.categoria, self.actual, clasificacion, fecha, registro)
+        self.actual = clasificacion
+        self._candidata = None
+        self._repeticiones = 0
+        self._ultimo_evento = fecha
+        for suscriptor in self.suscriptores:
+            try:
+                suscriptor(evento)
+            except Exception as error:
+                logger.exception("Suscriptor %r falló con el evento %s -> %s", suscriptor,
+                                 evento.anterior, evento.nueva)
+                self.errores.append((evento, error))
+        return evento
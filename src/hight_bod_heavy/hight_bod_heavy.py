@@ -1,14 +1,32 @@
+from array import array
 from collections import deque
 from datetime import datetime
+from itertools import product
+import math
 import statistics
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence
+
+from .agregacion import MotorAgrupacion, columnas_desde_registros, columnas_requeridas
+from .resumenes import ResumenesPoblacion
+from . import instantaneas
+from .eventos import DetectorTransiciones
 
 class CalculadoraIMC:
     """Clase para calcular y clasificar el Índice de Masa Corporal"""
     
+    # Tipo de cada columna del historial (código de array o None para listas)
+    TIPOS_COLUMNAS = {'peso_kg': 'd', 'altura_m': 'd', 'imc': 'd', 'clasificacion': None, 'fecha': None}
+    # Columnas con resumen incremental: nombre -> bins del histograma (inicio, fin, cantidad)
+    COLUMNAS_RESUMEN = {'imc': (10, 50, 40)}
+    # Tipo de cada campo de los cálculos encolados
+    TIPOS_COLA = {'peso_kg': 'd', 'altura_m': 'd'}
+    
     def __init__(self):
         self.historial_imc = []  # LISTA para historial
         self.cola_imc = deque()  # COLA para procesamiento
+        self.resumenes = ResumenesPoblacion(self.COLUMNAS_RESUMEN)
+        self._marca_instantanea = 0  # Registros incluidos en la última instantánea
+        self.transiciones = DetectorTransiciones('imc')
     
     @staticmethod
     def calcular(peso_kg: float, altura_m: float) -> float:
@@ -51,6 +69,8 @@ class CalculadoraIMC:
         }
         
         self.historial_imc.append(registro)
+        self.resumenes.actualizar(registro)
+        self.transiciones.observar(clasificacion, registro)
     
     def encolar_calculo(self, peso_kg: float, altura_m: float):
         """Encola cálculo para procesamiento posterior"""
@@ -96,6 +116,9 @@ class CalculadoraIMC:
         """Limpia todo el historial (requiere confirmación)"""
         if confirmacion and self.historial_imc:
             self.historial_imc.clear()
+            self.resumenes.limpiar()
+            self._marca_instantanea = 0
+            self.transiciones.reiniciar()
             return True
         return False
     
@@ -122,14 +145,54 @@ class CalculadoraIMC:
             'peso_max_ideal_kg': peso_max,
             'rango_recomendado': f"{peso_min:.1f} - {peso_max:.1f} kg"
         }
+    
+    def obtener_columnas(self, nombres: Optional[Sequence[str]] = None) -> Dict[str, Sequence]:
+        """Retorna el historial en formato de columnas (solo `nombres`, si se indican)"""
+        return columnas_desde_registros(self.historial_imc, self.TIPOS_COLUMNAS, nombres)
+    
+    def agrupar(self, claves, valor: str = 'imc', agregados=('conteo', 'media'), **opciones) -> Dict:
+        """Agrupa el historial por claves arbitrarias (ver MotorAgrupacion.agrupar)"""
+        columnas = self.obtener_columnas(columnas_requeridas(claves, valor))
+        return MotorAgrupacion(columnas).agrupar(claves, valor, agregados, **opciones)
+    
+    def obtener_percentiles(self, columna: str = 'imc', percentiles=(5, 50, 95)) -> Dict[float, float]:
+        """Percentiles aproximados del historial (sin recorrerlo)"""
+        return self.resumenes.percentiles(columna, percentiles)
+    
+    def obtener_histograma(self, columna: str = 'imc') -> Dict:
+        """Histograma de bins fijos del historial"""
+        return self.resumenes.histograma(columna)
+    
+    def snapshot(self, delta: bool = False, compresion: Optional[str] = None, nivel: int = 6) -> bytes:
+        """Serializa el historial y la cola en binario (delta=True: solo registros nuevos)"""
+        base = self._marca_instantanea if delta else 0
+        datos = instantaneas.codificar(type(self).__name__, self.historial_imc[base:], self.cola_imc,
+                                       self.TIPOS_COLUMNAS, self.TIPOS_COLA, base, delta,
+                                       compresion, nivel)
+        self._marca_instantanea = len(self.historial_imc)
+        return datos
+    
+    def restaurar(self, datos: bytes):
+        """Restaura el estado desde snapshot(); un delta se agrega al estado actual"""
+        self._marca_instantanea = instantaneas.restaurar_estado(
+            datos, type(self).__name__, self.historial_imc, self.cola_imc, self.resumenes)
+        self.transiciones.reiniciar(self.historial_imc[-1]['clasificacion'] if self.historial_imc else None)
 
 
 class CalculadoraGrasaCorporal:
     """Clase para calcular el porcentaje de grasa corporal"""
     
+    TIPOS_COLUMNAS = {'imc': 'd', 'edad': 'd', 'sexo': None, 'porcentaje_grasa': 'd',
+                      'clasificacion_grasa': None, 'fecha': None}
+    COLUMNAS_RESUMEN = {'porcentaje_grasa': (0, 60, 60), 'imc': (10, 50, 40)}
+    TIPOS_COLA = {'imc': 'd', 'edad': 'd', 'sexo': None}
+    
     def __init__(self):
         self.registros_grasa = []  # LISTA para registros
         self.cola_grasa = deque()  # COLA para cálculos
+        self.resumenes = ResumenesPoblacion(self.COLUMNAS_RESUMEN)
+        self._marca_instantanea = 0
+        self.transiciones = DetectorTransiciones('grasa')
     
     @staticmethod
     def calcular(imc: float, edad: int, sexo: str) -> float:
@@ -190,6 +253,8 @@ class CalculadoraGrasaCorporal:
         }
         
         self.registros_grasa.append(registro)
+        self.resumenes.actualizar(registro)
+        self.transiciones.observar(clasificacion, registro)
     
     def encolar_calculo(self, imc: float, edad: int, sexo: str):
         """Encola cálculo para procesamiento posterior"""
@@ -238,14 +303,46 @@ class CalculadoraGrasaCorporal:
     
     def obtener_promedio_por_edad(self) -> Dict[int, float]:
         """Calcula el promedio de grasa por grupo de edad"""
-        grupos = {}
+        sumas, conteos = {}, {}
         for registro in self.registros_grasa:
             grupo_edad = (registro['edad'] // 10) * 10  # Agrupa por década
-            if grupo_edad not in grupos:
-                grupos[grupo_edad] = []
-            grupos[grupo_edad].append(registro['porcentaje_grasa'])
+            sumas[grupo_edad] = sumas.get(grupo_edad, 0) + registro['porcentaje_grasa']
+            conteos[grupo_edad] = conteos.get(grupo_edad, 0) + 1
         
-        return {edad: statistics.mean(valores) for edad, valores in grupos.items()}
+        return {edad: sumas[edad] / conteos[edad] for edad in sumas}
+    
+    def obtener_columnas(self, nombres: Optional[Sequence[str]] = None) -> Dict[str, Sequence]:
+        """Retorna los registros en formato de columnas (solo `nombres`, si se indican)"""
+        return columnas_desde_registros(self.registros_grasa, self.TIPOS_COLUMNAS, nombres)
+    
+    def agrupar(self, claves, valor: str = 'porcentaje_grasa', agregados=('conteo', 'media'),
+                **opciones) -> Dict:
+        """Agrupa los registros por claves arbitrarias (ver MotorAgrupacion.agrupar)"""
+        columnas = self.obtener_columnas(columnas_requeridas(claves, valor))
+        return MotorAgrupacion(columnas).agrupar(claves, valor, agregados, **opciones)
+    
+    def obtener_percentiles(self, columna: str = 'porcentaje_grasa', percentiles=(5, 50, 95)) -> Dict[float, float]:
+        """Percentiles aproximados de los registros (sin recorrerlos)"""
+        return self.resumenes.percentiles(columna, percentiles)
+    
+    def obtener_histograma(self, columna: str = 'porcentaje_grasa') -> Dict:
+        """Histograma de bins fijos de los registros"""
+        return self.resumenes.histograma(columna)
+    
+    def snapshot(self, delta: bool = False, compresion: Optional[str] = None, nivel: int = 6) -> bytes:
+        """Serializa los registros y la cola en binario (delta=True: solo registros nuevos)"""
+        base = self._marca_instantanea if delta else 0
+        datos = instantaneas.codificar(type(self).__name__, self.registros_grasa[base:], self.cola_grasa,
+                                       self.TIPOS_COLUMNAS, self.TIPOS_COLA, base, delta,
+                                       compresion, nivel)
+        self._marca_instantanea = len(self.registros_grasa)
+        return datos
+    
+    def restaurar(self, datos: bytes):
+        """Restaura el estado desde snapshot(); un delta se agrega al estado actual"""
+        self._marca_instantanea = instantaneas.restaurar_estado(
+            datos, type(self).__name__, self.registros_grasa, self.cola_grasa, self.resumenes)
+        self.transiciones.reiniciar(self.registros_grasa[-1]['clasificacion_grasa'] if self.registros_grasa else None)
     
     def recomendar_objetivo(self, porcentaje_actual: float, sexo: str, edad: int) -> Dict:
         """Recomienda un objetivo saludable de grasa corporal"""
@@ -273,9 +370,18 @@ class CalculadoraGrasaCorporal:
 class CalculadoraMasaMuscular:
     """Clase para calcular la masa muscular y composición corporal"""
     
+    TIPOS_COLUMNAS = {'peso_total_kg': 'd', 'grasa_corporal_kg': 'd', 'masa_magra_kg': 'd',
+                      'porcentaje_grasa': 'd', 'porcentaje_muscular': 'd', 'fecha': None}
+    COLUMNAS_RESUMEN = {'porcentaje_grasa': (0, 60, 60), 'masa_magra_kg': (20, 120, 50)}
+    TIPOS_COLA = {'peso_kg': 'd', 'porcentaje_grasa': 'd'}
+    KCAL_POR_KG_GRASA = 7700
+    PERDIDA_SEMANAL_MAXIMA_KG = 1.0  # Máximo saludable
+    
     def __init__(self):
         self.composiciones = []  
         self.cola_composiciones = deque()  
+        self.resumenes = ResumenesPoblacion(self.COLUMNAS_RESUMEN)
+        self._marca_instantanea = 0
     
     @staticmethod
     def calcular(peso_kg: float, porcentaje_grasa: float) -> dict:
@@ -302,6 +408,7 @@ class CalculadoraMasaMuscular:
         composicion['fecha'] = datetime.now()
         
         self.composiciones.append(composicion)
+        self.resumenes.actualizar(composicion)
     
     def encolar_analisis(self, peso_kg: float, porcentaje_grasa: float):
         """Encola análisis para procesamiento posterior"""
@@ -371,6 +478,38 @@ class CalculadoraMasaMuscular:
         else:
             return "Enfoque en mantenimiento y tonificación"
     
+    def obtener_columnas(self, nombres: Optional[Sequence[str]] = None) -> Dict[str, Sequence]:
+        """Retorna las composiciones en formato de columnas (solo `nombres`, si se indican)"""
+        return columnas_desde_registros(self.composiciones, self.TIPOS_COLUMNAS, nombres)
+    
+    def agrupar(self, claves, valor: str = 'masa_magra_kg', agregados=('conteo', 'media'),
+                **opciones) -> Dict:
+        """Agrupa las composiciones por claves arbitrarias (ver MotorAgrupacion.agrupar)"""
+        columnas = self.obtener_columnas(columnas_requeridas(claves, valor))
+        return MotorAgrupacion(columnas).agrupar(claves, valor, agregados, **opciones)
+    
+    def obtener_percentiles(self, columna: str = 'masa_magra_kg', percentiles=(5, 50, 95)) -> Dict[float, float]:
+        """Percentiles aproximados de las composiciones (sin recorrerlas)"""
+        return self.resumenes.percentiles(columna, percentiles)
+    
+    def obtener_histograma(self, columna: str = 'masa_magra_kg') -> Dict:
+        """Histograma de bins fijos de las composiciones"""
+        return self.resumenes.histograma(columna)
+    
+    def snapshot(self, delta: bool = False, compresion: Optional[str] = None, nivel: int = 6) -> bytes:
+        """Serializa las composiciones y la cola en binario (delta=True: solo registros nuevos)"""
+        base = self._marca_instantanea if delta else 0
+        datos = instantaneas.codificar(type(self).__name__, self.composiciones[base:], self.cola_composiciones,
+                                       self.TIPOS_COLUMNAS, self.TIPOS_COLA, base, delta,
+                                       compresion, nivel)
+        self._marca_instantanea = len(self.composiciones)
+        return datos
+    
+    def restaurar(self, datos: bytes):
+        """Restaura el estado desde snapshot(); un delta se agrega al estado actual"""
+        self._marca_instantanea = instantaneas.restaurar_estado(
+            datos, type(self).__name__, self.composiciones, self.cola_composiciones, self.resumenes)
+    
     def predecir_composicion(self, peso_objetivo: float, porcentaje_grasa_objetivo: float) -> Dict:
         """Predice la composición corporal para un peso y porcentaje de grasa objetivo"""
         return self.calcular(peso_objetivo, porcentaje_grasa_objetivo)
@@ -385,7 +524,7 @@ class CalculadoraMasaMuscular:
         composicion_objetivo = self.predecir_composicion(peso_objetivo, porcentaje_grasa_objetivo)
         
         grasa_a_perder = composicion_actual['grasa_corporal_kg'] - composicion_objetivo['grasa_corporal_kg']
-        calorias_totales_deficit = grasa_a_perder * 7700  # 7700 kcal por kg de grasa
+        calorias_totales_deficit = grasa_a_perder * self.KCAL_POR_KG_GRASA
         deficit_diario = calorias_totales_deficit / (semanas * 7)
         
         return {
@@ -393,5 +532,129 @@ class CalculadoraMasaMuscular:
             'deficit_calorico_diario': deficit_diario,
             'semanas_estimadas': semanas,
             'perdida_semanal_kg': grasa_a_perder / semanas,
-            'es_saludable': (grasa_a_perder / semanas) <= 1.0  # Máximo 1kg por semana
-        }
\ No newline at end of file
+            'es_saludable': (grasa_a_perder / semanas) <= self.PERDIDA_SEMANAL_MAXIMA_KG
+        }
+    
+    @staticmethod
+    def _grasa_objetivo_kg(pesos_objetivo, porcentajes_grasa_objetivo) -> array:
+        """Grasa objetivo (kg) para columnas de peso y porcentaje de grasa"""
+        grasas = array('d')
+        for peso, porcentaje in zip(pesos_objetivo, porcentajes_grasa_objetivo):
+            if peso <= 0:
+                raise ValueError("El peso debe ser mayor a cero")
+            if porcentaje < 0 or porcentaje > 100:
+                raise ValueError("El porcentaje de grasa debe estar entre 0 y 100")
+            grasas.append(porcentaje / 100 * peso)
+        return grasas
+    
+    def simular_escenarios(self, pesos_objetivo, porcentajes_grasa_objetivo, semanas=12,
+                           grilla: bool = False, grasa_actual_kg=None) -> Dict:
+        """Calcula déficit, pérdida semanal y si es saludable para muchos escenarios a la vez.
+        
+        Acepta escalares o secuencias. grasa_actual_kg permite simular varios usuarios;
+        por defecto se usa la última composición. Con grilla=True evalúa el producto
+        cartesiano de (grasa_actual_kg, peso_objetivo, porcentaje_grasa_objetivo, semanas),
+        es decir, la grilla completa para cada usuario; si no, las secuencias se recorren
+        en paralelo. Retorna columnas nuevas con una fila por escenario: array('d'),
+        salvo semanas (array('q')) y es_saludable (lista).
+        """
+        if grasa_actual_kg is None:
+            if not self.composiciones:
+                return {'error': 'No hay composición actual disponible'}
+            grasa_actual_kg = self.composiciones[-1]['grasa_corporal_kg']
+        
+        if grilla:
+            combinaciones = list(product(_como_secuencia(grasa_actual_kg),
+                                         _como_secuencia(pesos_objetivo),
+                                         _como_secuencia(porcentajes_grasa_objetivo),
+                                         _como_secuencia(semanas)))
+            grasas_actuales = array('d', (c[0] for c in combinaciones))
+            pesos = array('d', (c[1] for c in combinaciones))
+            porcentajes = array('d', (c[2] for c in combinaciones))
+            semanas_col = array('d', (c[3] for c in combinaciones))
+        else:
+            pesos, porcentajes, semanas_col, grasas_actuales = _ampliar_columnas(
+                pesos_objetivo, porcentajes_grasa_objetivo, semanas, grasa_actual_kg)
+        
+        if any(s <= 0 for s in semanas_col):
+            raise ValueError("Las semanas deben ser mayores a cero")
+        if any(s != int(s) for s in semanas_col):
+            raise ValueError("Las semanas deben ser un número entero")
+        semanas_col = array('q', map(int, semanas_col))
+        
+        grasas_objetivo = self._grasa_objetivo_kg(pesos, porcentajes)
+        kcal_por_dia = self.KCAL_POR_KG_GRASA / 7
+        maxima = self.PERDIDA_SEMANAL_MAXIMA_KG
+        
+        grasa_a_perder = array('d', (a - o for a, o in zip(grasas_actuales, grasas_objetivo)))
+        perdida_semanal = array('d', (g / s for g, s in zip(grasa_a_perder, semanas_col)))
+        return {
+            'grasa_actual_kg': grasas_actuales,
+            'peso_objetivo': pesos,
+            'porcentaje_grasa_objetivo': porcentajes,
+            'semanas': semanas_col,
+            'grasa_a_perder_kg': grasa_a_perder,
+            'deficit_calorico_diario': array('d', (p * kcal_por_dia for p in perdida_semanal)),
+            'perdida_semanal_kg': perdida_semanal,
+            'es_saludable': [p <= maxima for p in perdida_semanal]
+        }
+    
+    @classmethod
+    def planes_saludables_mas_cortos(cls, grasas_actuales_kg, pesos_objetivo, porcentajes_grasa_objetivo,
+                                     semanas_maximas: Optional[int] = None) -> Dict:
+        """Calcula para cada usuario el plan saludable más corto (en semanas enteras).
+        
+        Cada argumento es un escalar o una secuencia con un valor por usuario. Si el
+        plan supera semanas_maximas, sus semanas quedan en 0 y es_alcanzable en False.
+        """
+        grasas_actuales, pesos, porcentajes = _ampliar_columnas(
+            grasas_actuales_kg, pesos_objetivo, porcentajes_grasa_objetivo)
+        grasas_objetivo = cls._grasa_objetivo_kg(pesos, porcentajes)
+        maxima = cls.PERDIDA_SEMANAL_MAXIMA_KG
+        kcal_por_dia = cls.KCAL_POR_KG_GRASA / 7
+        
+        grasa_a_perder = array('d')
+        semanas = array('q')
+        deficit = array('d')
+        perdida_semanal = array('d')
+        alcanzable = []
+        for actual, objetivo in zip(grasas_actuales, grasas_objetivo):
+            perder = actual - objetivo
+            # Menor número entero de semanas con perder / semanas <= máximo saludable
+            minimas = max(1, math.ceil(perder / maxima))
+            es_alcanzable = semanas_maximas is None or minimas <= semanas_maximas
+            perdida = perder / minimas if es_alcanzable else 0.0
+            grasa_a_perder.append(perder)
+            semanas.append(minimas if es_alcanzable else 0)
+            perdida_semanal.append(perdida)
+            deficit.append(perdida * kcal_por_dia)
+            alcanzable.append(es_alcanzable)
+        
+        return {
+            'grasa_a_perder_kg': grasa_a_perder,
+            'semanas': semanas,
+            'perdida_semanal_kg': perdida_semanal,
+            'deficit_calorico_diario': deficit,
+            'es_alcanzable': alcanzable
+        }
+
+
+def _como_secuencia(valor) -> Sequence:
+    """Convierte un escalar en una secuencia de un elemento"""
+    return valor if hasattr(valor, '__len__') and not isinstance(valor, str) else (valor,)
+
+
+def _ampliar(valor, cantidad: int) -> array:
+    """Columna nueva array('d') de largo `cantidad`: repite un escalar o copia una secuencia"""
+    secuencia = _como_secuencia(valor)
+    if len(secuencia) == cantidad:
+        return array('d', secuencia)
+    if len(secuencia) == 1:
+        return array('d', secuencia) * cantidad
+    raise ValueError("Las secuencias deben tener el mismo largo")
+
+
+def _ampliar_columnas(*valores) -> List[Sequence]:
+    """Lleva escalares y secuencias a columnas del mismo largo"""
+    cantidad = max(len(_como_secuencia(valor)) for valor in valores)
+    return [_ampliar(valor, cantidad) for valor in valores]
\ No newline at end of file
@@ -0,0 +1,222 @@
+from array import array
+from datetime import datetime
+from functools import lru_cache
+import lzma
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+MAGICO = b'HBH1'
+COMPRESIONES = {None: 0, 'zlib': 1, 'lzma': 2}
+
+# Representación de cada columna en el formato binario
+_NUMERO, _FECHA, _TEXTO, _VACIA = 1, 2, 3, 4
+
+_LARGO_FECHA = 10  # Bytes del estado de un datetime sin zona horaria
+
+_CABECERA = struct.Struct('<4sBB')  # mágico, compresión, es_delta
+_CUERPO = struct.Struct('<QIIHH')  # base, registros, pendientes, columnas de cada uno
+_COLUMNA = struct.Struct('<cBI')  # tipo declarado (código de array o b'-'), representación, largo
+
+
+def _a_bytes(columna: array) -> bytes:
+    """Bytes little-endian de un array"""
+    if sys.byteorder == 'big':
+        columna = array(columna.typecode, columna)
+        columna.byteswap()
+    return columna.tobytes()
+
+
+def _desde_bytes(typecode: str, datos: bytes) -> array:
+    columna = array(typecode)
+    columna.frombytes(datos)
+    if sys.byteorder == 'big':
+        columna.byteswap()
+    return columna
+
+
+def _codificar_columna(valores: Sequence, tipo: Optional[str]) -> bytes:
+    """Empaqueta una columna según su tipo declarado (código de array o None).
+
+    Las columnas numéricas se guardan con su código de array; si una columna real
+    tiene enteros, se agrega una marca por fila para restaurarlos como int. Las
+    columnas sin código se guardan como fechas o textos con diccionario.
+    """
+    declarado = tipo.encode('ascii') if tipo else b'-'
+    if not valores:
+        return _COLUMNA.pack(declarado, _VACIA, 0)
+    if tipo:
+        numeros = _a_bytes(array(tipo, valores))
+        enteros = b''
+        if tipo in 'fd' and any(type(v) is int for v in valores):
+            enteros = bytes(type(v) is int for v in valores)
+        representacion = _NUMERO
+        datos = struct.pack('<I', len(numeros)) + numeros + enteros
+    elif isinstance(valores[0], datetime):
+        # Estado de 10 bytes de pickle: datetime(estado) lo reconstruye en C al restaurar
+        representacion = _FECHA
+        estados = [v.__reduce__()[1] for v in valores]
+        if any(len(estado) != 1 for estado in estados):
+            raise ValueError("Las fechas con zona horaria no se pueden guardar en una instantánea")
+        datos = b''.join([estado[0] for estado in estados])
+    elif isinstance(valores[0], str):
+        representacion = _TEXTO
+        diccionario = {}
+        codigos = array('H', (diccionario.setdefault(v, len(diccionario)) for v in valores))
+        partes = [struct.pack('<H', len(diccionario))]
+        for texto in diccionario:
+            codificado = texto.encode('utf-8')
+            partes.append(struct.pack('<H', len(codificado)))
+            partes.append(codificado)
+        partes.append(_a_bytes(codigos))
+        datos = b''.join(partes)
+    else:
+        raise TypeError(f"Columna sin tipo declarado con valores no soportados: {type(valores[0]).__name__}")
+    return _COLUMNA.pack(declarado, representacion, len(datos)) + datos
+
+
+def _decodificar_columna(tipo: str, representacion: int, datos: bytes) -> List:
+    if representacion == _VACIA:
+        return []
+    if representacion == _NUMERO:
+        (largo,) = struct.unpack_from('<I', datos, 0)
+        valores = _desde_bytes(tipo, datos[4:4 + largo]).tolist()
+        enteros = datos[4 + largo:]
+        if enteros:
+            valores = [int(v) if entero else v for v, entero in zip(valores, enteros)]
+        return valores
+    if representacion == _FECHA:
+        # Un solo unpack separa todos los estados; cortarlos uno a uno es más lento
+        estados = struct.Struct(f'{_LARGO_FECHA}s' * (len(datos) // _LARGO_FECHA)).unpack(datos)
+        return list(map(datetime, estados))
+    if representacion == _TEXTO:
+        (cantidad,) = struct.unpack_from('<H', datos, 0)
+        posicion = 2
+        diccionario = []
+        for _ in range(cantidad):
+            (largo,) = struct.unpack_from('<H', datos, posicion)
+            posicion += 2
+            diccionario.append(datos[posicion:posicion + largo].decode('utf-8'))
+            posicion += largo
+        return list(map(diccionario.__getitem__, _desde_bytes('H', datos[posicion:])))
+    raise ValueError(f"Representación de columna desconocida: {representacion}")
+
+
+def _nombre_bytes(nombre: str) -> bytes:
+    codificado = nombre.encode('utf-8')
+    return struct.pack('<B', len(codificado)) + codificado
+
+
+def codificar(clase: str, registros: List[Dict], pendientes: Sequence[Dict],
+              tipos_registro: Dict[str, Optional[str]], tipos_pendiente: Dict[str, Optional[str]],
+              base: int = 0, es_delta: bool = False, compresion: Optional[str] = None, nivel: int = 6) -> bytes:
+    """Codifica registros y cálculos pendientes en columnas binarias empaquetadas.
+
+    `tipos_registro` y `tipos_pendiente` asocian cada columna a un código de `array`
+    o a None (textos, fechas), como TIPOS_COLUMNAS; el tipo queda en la instantánea.
+    """
+    if compresion not in COMPRESIONES:
+        raise ValueError("Compresión no válida. Use None, 'zlib' o 'lzma'")
+    partes = [_nombre_bytes(clase),
+              _CUERPO.pack(base, len(registros), len(pendientes), len(tipos_registro), len(tipos_pendiente))]
+    for filas, tipos in ((registros, tipos_registro), (pendientes, tipos_pendiente)):
+        for nombre, tipo in tipos.items():
+            partes.append(_nombre_bytes(nombre))
+            partes.append(_codificar_columna([fila[nombre] for fila in filas], tipo))
+    cuerpo = b''.join(partes)
+    if compresion == 'zlib':
+        cuerpo = zlib.compress(cuerpo, nivel)
+    elif compresion == 'lzma':
+        cuerpo = lzma.compress(cuerpo, preset=nivel)
+    return _CABECERA.pack(MAGICO, COMPRESIONES[compresion], es_delta) + cuerpo
+
+
+def _decodificar_columnas(datos: bytes) -> Dict:
+    """Decodifica una instantánea dejando registros y pendientes como columnas"""
+    magico, compresion, es_delta = _CABECERA.unpack_from(datos, 0)
+    if magico != MAGICO:
+        raise ValueError("Los datos no son una instantánea válida")
+    if compresion not in COMPRESIONES.values():
+        raise ValueError(f"Compresión desconocida en la instantánea: {compresion}")
+    cuerpo = datos[_CABECERA.size:]
+    if compresion == COMPRESIONES['zlib']:
+        cuerpo = zlib.decompress(cuerpo)
+    elif compresion == COMPRESIONES['lzma']:
+        cuerpo = lzma.decompress(cuerpo)
+
+    (largo,) = struct.unpack_from('<B', cuerpo, 0)
+    clase = cuerpo[1:1 + largo].decode('utf-8')
+    posicion = 1 + largo
+    base, total_registros, total_pendientes, columnas_registro, columnas_pendiente = \
+        _CUERPO.unpack_from(cuerpo, posicion)
+    posicion += _CUERPO.size
+
+    columnas = []
+    for _ in range(columnas_registro + columnas_pendiente):
+        (largo,) = struct.unpack_from('<B', cuerpo, posicion)
+        nombre = cuerpo[posicion + 1:posicion + 1 + largo].decode('utf-8')
+        posicion += 1 + largo
+        tipo, representacion, largo_datos = _COLUMNA.unpack_from(cuerpo, posicion)
+        posicion += _COLUMNA.size
+        columnas.append((nombre, _decodificar_columna(tipo.decode('ascii'), representacion,
+                                                      cuerpo[posicion:posicion + largo_datos])))
+        posicion += largo_datos
+
+    return {
+        'clase': clase,
+        'base': base,
+        'es_delta': bool(es_delta),
+        'registros': dict(columnas[:columnas_registro]),
+        'pendientes': dict(columnas[columnas_registro:])
+    }
+
+
+def decodificar(datos: bytes) -> Dict:
+    """Decodifica una instantánea. Retorna clase, base, es_delta, registros y pendientes"""
+    estado = _decodificar_columnas(datos)
+    estado['registros'] = _filas(estado['registros'])
+    estado['pendientes'] = _filas(estado['pendientes'])
+    return estado
+
+
+@lru_cache(maxsize=32)
+def _constructor_filas(nombres: Tuple[str, ...]) -> Callable:
+    """Función que arma un registro a partir de un valor por columna.
+
+    Un literal de dict es bastante más rápido que dict(zip(...)) por fila; los
+    nombres entran al código solo como literales de texto (repr).
+    """
+    parametros = ', '.join(f'_{i}' for i in range(len(nombres)))
+    campos = ', '.join(f'{nombre!r}: _{i}' for i, nombre in enumerate(nombres))
+    return eval(f'lambda {parametros}: {{{campos}}}')
+
+
+def _filas(columnas: Dict[str, List]) -> List[Dict]:
+    if not columnas:
+        return []
+    return list(map(_constructor_filas(tuple(columnas)), *columnas.values()))
+
+
+def restaurar_estado(datos: bytes, clase: str, registros: List[Dict], cola, resumenes) -> int:
+    """Aplica una instantánea sobre el historial y la cola de una calculadora.
+
+    Una instantánea completa reemplaza el estado; un delta agrega sus registros y
+    solo es válido si el historial tiene exactamente los registros de su base.
+    Retorna la nueva cantidad de registros.
+    """
+    estado = _decodificar_columnas(datos)
+    if estado['clase'] != clase:
+        raise ValueError(f"La instantánea es de {estado['clase']}, no de {clase}")
+    if estado['es_delta']:
+        if estado['base'] != len(registros):
+            raise ValueError("El delta no corresponde al historial actual")
+    else:
+        registros.clear()
+        resumenes.limpiar()
+    # Los resúmenes reciben las columnas decodificadas, sin pasar registro por registro
+    registros.extend(_filas(estado['registros']))
+    resumenes.extender(estado['registros'])
+    cola.clear()
+    cola.extend(_filas(estado['pendientes']))
+    return len(registros)
@@ -0,0 +1,504 @@
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+import os
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+from .hight_bod_heavy import CalculadoraIMC, CalculadoraGrasaCorporal, CalculadoraMasaMuscular
+from .resumenes import ResumenesPoblacion
+
+# Atributo que guarda los registros en cada calculadora
+ATRIBUTOS_REGISTROS = {
+    'CalculadoraIMC': 'historial_imc',
+    'CalculadoraGrasaCorporal': 'registros_grasa',
+    'CalculadoraMasaMuscular': 'composiciones',
+}
+_CLASES = {clase.__name__: clase for clase in (CalculadoraIMC, CalculadoraGrasaCorporal, CalculadoraMasaMuscular)}
+
+MAGICO = b'HBR1'
+MAGICO_CONTROL = b'HBRC'
+TAMANO_DICCIONARIO = 65536
+TAMANO_RESUMENES = 131072
+_REAL, _FECHA, _TEXTO = 1, 2, 3
+_EPOCA = datetime(1970, 1, 1)
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+# mágico, secuencia, generación, total, capacidad, columnas, bytes de resúmenes, clase, siguiente segmento
+_CABECERA = struct.Struct('<4sQQQQII32s32s')
+_DESCRIPTOR = struct.Struct('<24sBQ')  # nombre, tipo, offset
+_SECUENCIA, _GENERACION, _TOTAL, _LARGO_RESUMENES = 4, 12, 20, 40
+# Segmento de control con nombre fijo: mágico, secuencia, nombre del segmento de datos vigente
+_CONTROL = struct.Struct('<4sQ32s')
+# Bytes por fila: las columnas reales llevan además una marca por fila para restaurar enteros
+_ANCHOS = {_REAL: 9, _FECHA: 8, _TEXTO: 2}
+# Segmentos creados por este proceso (su resource_tracker sí debe eliminarlos)
+_PROPIOS = set()
+
+
+def _validar_disponible():
+    if shared_memory is None:
+        raise RuntimeError("Las réplicas en memoria compartida requieren Python 3.8 o superior")
+
+
+def _abrir_segmento(nombre: str):
+    """Se adjunta a un segmento existente sin que el proceso lector pase a ser su dueño"""
+    try:
+        return shared_memory.SharedMemory(name=nombre, track=False)
+    except TypeError:
+        pass
+    # Python < 3.13: adjuntarse registra el segmento en el resource_tracker del lector,
+    # que lo eliminaría al terminar el proceso; se quita solo ese registro
+    segmento = shared_memory.SharedMemory(name=nombre)
+    if os.name == 'posix' and nombre not in _PROPIOS:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segmento._name, 'shared_memory')
+    return segmento
+
+
+def _crear_segmento_propio(nombre: Optional[str], tamano: int):
+    segmento = shared_memory.SharedMemory(name=nombre, create=True, size=tamano)
+    _PROPIOS.add(segmento.name)
+    return segmento
+
+
+def _eliminar_segmento_propio(segmento):
+    segmento.close()
+    segmento.unlink()
+    _PROPIOS.discard(segmento.name)
+
+
+def _tipos_de(clase: str) -> List:
+    """Columnas y tipo de almacenamiento (reales y fechas primero para alinear a 8 bytes)"""
+    columnas = []
+    for nombre, tipo in _CLASES[clase].TIPOS_COLUMNAS.items():
+        if tipo:
+            columnas.append((nombre, _REAL))
+        elif nombre == 'fecha':
+            columnas.append((nombre, _FECHA))
+        else:
+            columnas.append((nombre, _TEXTO))
+    return sorted(columnas, key=lambda columna: columna[1] == _TEXTO)
+
+
+def _alinear(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+def _tamano_segmento(cantidad_columnas: int, columnas: List, capacidad: int) -> int:
+    datos = sum(_alinear(capacidad * _ANCHOS[tipo]) for _, tipo in columnas)
+    return _alinear(_CABECERA.size + cantidad_columnas * _DESCRIPTOR.size + TAMANO_DICCIONARIO
+                    + TAMANO_RESUMENES) + datos
+
+
+class PublicadorMemoria:
+    """Publica los registros de una calculadora en memoria compartida (proceso escritor).
+
+    Los lectores se adjuntan a un segmento de control de nombre fijo (`nombre`) que
+    indica el segmento de datos vigente. Los datos se agregan al final sin tocar las
+    filas ya publicadas; un contador de secuencia (seqlock) protege el total, el
+    diccionario de textos y los resúmenes, y la generación cambia cuando el historial
+    se reescribe (limpieza o restauración). Si el historial supera la capacidad, se
+    llena un segmento más grande y recién entonces se publica en el control.
+
+    Todo se codifica antes de abrir la sección crítica, de modo que un error (por
+    ejemplo, resúmenes que no entran en el espacio reservado) deja la secuencia par.
+    Las columnas reales guardan una marca por fila para que los enteros (como la
+    edad) lleguen a las réplicas como int, igual que en el escritor.
+    """
+
+    def __init__(self, calculadora, capacidad: int = 1024, nombre: Optional[str] = None):
+        _validar_disponible()
+        if nombre is not None and len(nombre) > 24:
+            raise ValueError("El nombre del segmento debe tener como mucho 24 caracteres")
+        self.calculadora = calculadora
+        self.clase = type(calculadora).__name__
+        if self.clase not in ATRIBUTOS_REGISTROS:
+            raise ValueError(f"Calculadora no soportada: {self.clase}")
+        self.columnas = _tipos_de(self.clase)
+        self._diccionario: Dict[str, int] = {}
+        resumenes = self._codificar_resumenes()
+        self._control = _crear_segmento_propio(nombre, _CONTROL.size)
+        _CONTROL.pack_into(self._control.buf, 0, MAGICO_CONTROL, 0, b'')
+        self._reubicaciones = 0
+        self._publicados = 0
+        self._ultimo_publicado = None
+        self._crear_segmento(max(capacidad, 1))
+        self._escribir_diccionario(self._codificar_diccionario())
+        self._escribir_resumenes(resumenes)
+        self._publicar_nombre()
+
+    @property
+    def nombre(self) -> str:
+        """Nombre fijo (segmento de control) que deben usar los lectores"""
+        return self._control.name
+
+    def _crear_segmento(self, capacidad: int):
+        """Crea un segmento de datos vacío; no es visible hasta _publicar_nombre"""
+        self._reubicaciones += 1
+        self._segmento = _crear_segmento_propio(f"{self._control.name}_{self._reubicaciones}",
+                                                _tamano_segmento(len(self.columnas), self.columnas, capacidad))
+        self.capacidad = capacidad
+        buffer = self._segmento.buf
+        _CABECERA.pack_into(buffer, 0, MAGICO, 0, 0, 0, capacidad, len(self.columnas), 0,
+                            self.clase.encode('utf-8'), b'')
+        self._inicio_diccionario = _CABECERA.size + len(self.columnas) * _DESCRIPTOR.size
+        self._inicio_resumenes = self._inicio_diccionario + TAMANO_DICCIONARIO
+        offset = _alinear(self._inicio_resumenes + TAMANO_RESUMENES)
+        self._offsets = {}
+        for i, (nombre_columna, tipo) in enumerate(self.columnas):
+            _DESCRIPTOR.pack_into(buffer, _CABECERA.size + i * _DESCRIPTOR.size,
+                                  nombre_columna.encode('utf-8'), tipo, offset)
+            self._offsets[nombre_columna] = offset
+            offset += _alinear(capacidad * _ANCHOS[tipo])
+
+    def _publicar_nombre(self):
+        """Apunta el segmento de control al segmento de datos actual"""
+        buffer = self._control.buf
+        secuencia = struct.unpack_from('<Q', buffer, 4)[0]
+        struct.pack_into('<Q', buffer, 4, secuencia + 1)
+        struct.pack_into('<32s', buffer, 12, self._segmento.name.encode('utf-8'))
+        struct.pack_into('<Q', buffer, 4, secuencia + 2)
+
+    def _codificar_diccionario(self) -> Tuple[bytes, int]:
+        """Textos del diccionario empaquetados y su cantidad"""
+        partes = []
+        for texto in self._diccionario:
+            codificado = texto.encode('utf-8')
+            partes.append(struct.pack('<H', len(codificado)) + codificado)
+        datos = b''.join(partes)
+        if len(datos) + 4 > TAMANO_DICCIONARIO:
+            raise ValueError("El diccionario de textos excede el espacio reservado")
+        return datos, len(self._diccionario)
+
+    def _escribir_diccionario(self, diccionario: Tuple[bytes, int]):
+        # Se llama dentro de la sección crítica: primero los textos y al final la cantidad
+        datos, cantidad = diccionario
+        inicio = self._inicio_diccionario + 4
+        self._segmento.buf[inicio:inicio + len(datos)] = datos
+        struct.pack_into('<I', self._segmento.buf, self._inicio_diccionario, cantidad)
+        self._textos_publicados = cantidad
+
+    def _codificar_resumenes(self) -> bytes:
+        datos = self.calculadora.resumenes.a_bytes()
+        if len(datos) > TAMANO_RESUMENES:
+            raise ValueError("Los resúmenes exceden el espacio reservado")
+        return datos
+
+    def _escribir_resumenes(self, datos: bytes):
+        # Se llama dentro de la sección crítica, igual que _escribir_diccionario
+        self._segmento.buf[self._inicio_resumenes:self._inicio_resumenes + len(datos)] = datos
+        struct.pack_into('<I', self._segmento.buf, _LARGO_RESUMENES, len(datos))
+
+    def _codificar_filas(self, registros: List[Dict]) -> Dict[str, Tuple[bytes, bytes]]:
+        """Bytes de cada columna y marcas de enteros (solo en columnas reales)"""
+        # Las columnas usan el orden de bytes nativo, igual que las vistas de los lectores
+        columnas = {}
+        for nombre_columna, tipo in self.columnas:
+            if tipo == _REAL:
+                valores = [registro[nombre_columna] for registro in registros]
+                columnas[nombre_columna] = (array('d', valores).tobytes(),
+                                            bytes(type(valor) is int for valor in valores))
+            elif tipo == _FECHA:
+                columnas[nombre_columna] = (array('q', ((registro[nombre_columna] - _EPOCA) // _MICROSEGUNDO
+                                                        for registro in registros)).tobytes(), b'')
+            else:
+                # El diccionario solo crece: los códigos ya publicados siguen siendo válidos
+                columnas[nombre_columna] = (array('H', (self._diccionario.setdefault(registro[nombre_columna],
+                                                                                     len(self._diccionario))
+                                                        for registro in registros)).tobytes(), b'')
+        return columnas
+
+    def _escribir_filas(self, columnas: Dict[str, Tuple[bytes, bytes]], desde: int):
+        """Copia las filas codificadas a partir de la fila `desde`"""
+        buffer = self._segmento.buf
+        for nombre_columna, tipo in self.columnas:
+            datos, enteros = columnas[nombre_columna]
+            inicio = self._offsets[nombre_columna] + desde * (2 if tipo == _TEXTO else 8)
+            buffer[inicio:inicio + len(datos)] = datos
+            if tipo == _REAL:
+                inicio = self._offsets[nombre_columna] + self.capacidad * 8 + desde
+                buffer[inicio:inicio + len(enteros)] = enteros
+
+    def _leer_campo(self, posicion: int) -> int:
+        return struct.unpack_from('<Q', self._segmento.buf, posicion)[0]
+
+    def _escribir_campo(self, posicion: int, valor: int):
+        struct.pack_into('<Q', self._segmento.buf, posicion, valor)
+
+    def _reubicar(self, registros: List[Dict], capacidad: int):
+        """Copia el historial a un segmento más grande y luego lo publica"""
+        columnas = self._codificar_filas(registros)
+        diccionario = self._codificar_diccionario()
+        resumenes = self._codificar_resumenes()
+        anterior = self._segmento
+        generacion = self._leer_campo(_GENERACION) + 1
+        self._crear_segmento(capacidad)
+        # El segmento nuevo queda completo antes de que un lector pueda encontrarlo
+        self._escribir_filas(columnas, 0)
+        self._escribir_diccionario(diccionario)
+        self._escribir_resumenes(resumenes)
+        self._escribir_campo(_TOTAL, len(registros))
+        self._escribir_campo(_GENERACION, generacion)
+        self._publicar_nombre()
+
+        # Los lectores del segmento anterior ven la marca y vuelven a resolver el nombre
+        buffer = anterior.buf
+        secuencia = struct.unpack_from('<Q', buffer, _SECUENCIA)[0]
+        struct.pack_into('<Q', buffer, _SECUENCIA, secuencia + 1)
+        struct.pack_into('<32s', buffer, _CABECERA.size - 32, self._segmento.name.encode('utf-8'))
+        struct.pack_into('<Q', buffer, _GENERACION, struct.unpack_from('<Q', buffer, _GENERACION)[0] + 1)
+        struct.pack_into('<Q', buffer, _SECUENCIA, secuencia + 2)
+        _eliminar_segmento_propio(anterior)
+
+    def sincronizar(self) -> int:
+        """Publica los registros nuevos de la calculadora. Retorna el total publicado"""
+        registros = getattr(self.calculadora, ATRIBUTOS_REGISTROS[self.clase])
+        reescribir = (len(registros) < self._publicados or
+                      (self._publicados and registros[self._publicados - 1] is not self._ultimo_publicado))
+        if len(registros) > self.capacidad:
+            self._reubicar(registros, max(self.capacidad * 2, len(registros)))
+        elif reescribir or len(registros) > self._publicados:
+            desde = 0 if reescribir else self._publicados
+            columnas = self._codificar_filas(registros[desde:])
+            diccionario = (self._codificar_diccionario()
+                           if len(self._diccionario) != self._textos_publicados else None)
+            resumenes = self._codificar_resumenes()
+            # Desde aquí solo se copian bytes ya validados: la secuencia vuelve a ser par
+            secuencia = self._leer_campo(_SECUENCIA)
+            if reescribir:
+                # Se invalida la generación antes de tocar filas que los lectores pueden estar usando
+                self._escribir_campo(_SECUENCIA, secuencia + 1)
+                self._escribir_campo(_GENERACION, self._leer_campo(_GENERACION) + 1)
+            # Sin reescritura, las filas nuevas quedan fuera del total visible
+            self._escribir_filas(columnas, desde)
+            self._escribir_campo(_SECUENCIA, secuencia + 1)  # impar: escritura en curso
+            if diccionario is not None:
+                self._escribir_diccionario(diccionario)
+            self._escribir_resumenes(resumenes)
+            self._escribir_campo(_TOTAL, len(registros))
+            self._escribir_campo(_SECUENCIA, secuencia + 2)
+
+        self._publicados = len(registros)
+        self._ultimo_publicado = registros[-1] if registros else None
+        return self._publicados
+
+    def cerrar(self):
+        """Libera y elimina el segmento de datos y el de control"""
+        for segmento in (self._segmento, self._control):
+            _eliminar_segmento_propio(segmento)
+
+
+class FilasCompartidas(Sequence):
+    """Secuencia de solo lectura de registros sobre vistas de memoria compartida"""
+
+    def __init__(self, vistas: Dict[str, memoryview], tipos: Dict[str, int], diccionario: List[str], total: int,
+                 enteros: Dict[str, memoryview]):
+        self._vistas = vistas
+        self._tipos = tipos
+        self._enteros = enteros
+        self._diccionario = diccionario
+        self._total = total
+
+    def __len__(self) -> int:
+        return self._total
+
+    def _valor(self, nombre: str, indice: int):
+        valor = self._vistas[nombre][indice]
+        tipo = self._tipos[nombre]
+        if tipo == _FECHA:
+            return _EPOCA + timedelta(microseconds=valor)
+        if tipo == _TEXTO:
+            return self._diccionario[valor]
+        return int(valor) if self._enteros[nombre][indice] else valor
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(self._total))]
+        if indice < 0:
+            indice += self._total
+        if not 0 <= indice < self._total:
+            raise IndexError("Índice fuera de rango")
+        return {nombre: self._valor(nombre, indice) for nombre in self._vistas}
+
+
+class ReplicaLectura:
+    """Réplica de solo lectura de una calculadora publicada con PublicadorMemoria.
+
+    Las lecturas no bloquean al escritor: `leer` reintenta si el escritor reescribió
+    el historial mientras se leía, de modo que siempre se observa un estado consistente.
+    Si el escritor cambió de segmento, el nombre se vuelve a resolver con el control.
+    Si el escritor deja una escritura a medias (por ejemplo, porque terminó su proceso),
+    las lecturas fallan con TimeoutError después de `espera_maxima` segundos.
+    """
+
+    def __init__(self, nombre: str, espera_maxima: float = 5.0):
+        _validar_disponible()
+        self.espera_maxima = espera_maxima
+        self._control = _abrir_segmento(nombre)
+        if _CONTROL.unpack_from(self._control.buf, 0)[0] != MAGICO_CONTROL:
+            self._control.close()
+            raise ValueError("El segmento no contiene una réplica válida")
+        self._segmento = None
+        self._adjuntar()
+
+    def _esperar(self, limite: float):
+        """Cede el procesador antes de reintentar, o falla si el escritor no termina"""
+        if time.monotonic() > limite:
+            raise TimeoutError(f"El escritor no completó la publicación en {self.espera_maxima} s")
+        time.sleep(0)
+
+    def _resolver(self) -> str:
+        """Nombre del segmento de datos vigente, leído con el protocolo seqlock"""
+        buffer = self._control.buf
+        limite = time.monotonic() + self.espera_maxima
+        while True:
+            secuencia = struct.unpack_from('<Q', buffer, 4)[0]
+            if secuencia % 2:
+                self._esperar(limite)
+                continue
+            nombre = struct.unpack_from('<32s', buffer, 12)[0]
+            if struct.unpack_from('<Q', buffer, 4)[0] == secuencia:
+                return nombre.rstrip(b'\0').decode('utf-8')
+            self._esperar(limite)
+
+    def _adjuntar(self):
+        if self._segmento is not None:
+            self._segmento.close()
+            self._segmento = None
+        while True:
+            nombre = self._resolver()
+            try:
+                segmento = _abrir_segmento(nombre)
+            except FileNotFoundError:
+                # El escritor se reubicó entre la lectura del control y la apertura
+                if self._resolver() == nombre:
+                    raise
+                continue
+            if struct.unpack_from('<32s', segmento.buf, _CABECERA.size - 32)[0].rstrip(b'\0'):
+                segmento.close()  # Ya reemplazado: el control apunta a uno más nuevo
+                continue
+            break
+        self._segmento = segmento
+        magico, _, _, _, self.capacidad, cantidad, _, clase, _ = _CABECERA.unpack_from(segmento.buf, 0)
+        if magico != MAGICO:
+            raise ValueError("El segmento no contiene una réplica válida")
+        self.clase = clase.rstrip(b'\0').decode('utf-8')
+        self._inicio_diccionario = _CABECERA.size + cantidad * _DESCRIPTOR.size
+        self._inicio_resumenes = self._inicio_diccionario + TAMANO_DICCIONARIO
+        self._columnas = []
+        for i in range(cantidad):
+            nombre_columna, tipo, offset = _DESCRIPTOR.unpack_from(segmento.buf, _CABECERA.size + i * _DESCRIPTOR.size)
+            self._columnas.append((nombre_columna.rstrip(b'\0').decode('utf-8'), tipo, offset))
+        self._diccionario: List[str] = []
+        self._resumenes = None
+        self._secuencia_resumenes = None
+
+    def _leer_campo(self, posicion: int) -> int:
+        return struct.unpack_from('<Q', self._segmento.buf, posicion)[0]
+
+    def _leer_diccionario(self) -> List[str]:
+        buffer = self._segmento.buf
+        (cantidad,) = struct.unpack_from('<I', buffer, self._inicio_diccionario)
+        if cantidad == len(self._diccionario):
+            return self._diccionario
+        posicion = self._inicio_diccionario + 4
+        textos = []
+        for _ in range(cantidad):
+            (largo,) = struct.unpack_from('<H', buffer, posicion)
+            textos.append(bytes(buffer[posicion + 2:posicion + 2 + largo]).decode('utf-8'))
+            posicion += 2 + largo
+        return textos
+
+    def _estado_estable(self):
+        """Lee (generación, total) y el diccionario con el protocolo seqlock.
+
+        El diccionario y los resúmenes solo se guardan en caché después de comprobar
+        que la secuencia no cambió; una lectura a medias se descarta y se repite.
+        """
+        limite = time.monotonic() + self.espera_maxima
+        while True:
+            secuencia = self._leer_campo(_SECUENCIA)
+            if secuencia % 2:
+                self._esperar(limite)
+                continue
+            generacion = self._leer_campo(_GENERACION)
+            total = self._leer_campo(_TOTAL)
+            resumenes = None
+            try:
+                diccionario = self._leer_diccionario()
+                if secuencia != self._secuencia_resumenes:
+                    (largo,) = struct.unpack_from('<I', self._segmento.buf, _LARGO_RESUMENES)
+                    resumenes = bytes(self._segmento.buf[self._inicio_resumenes:self._inicio_resumenes + largo])
+            except (struct.error, UnicodeDecodeError):
+                self._esperar(limite)
+                continue
+            if self._leer_campo(_SECUENCIA) != secuencia:
+                self._esperar(limite)
+                continue
+            self._diccionario = diccionario
+            if resumenes is not None:
+                self._resumenes = ResumenesPoblacion.desde_bytes(resumenes)
+                self._secuencia_resumenes = secuencia
+            return generacion, total
+
+    def _reubicado(self) -> bool:
+        return bool(struct.unpack_from('<32s', self._segmento.buf, _CABECERA.size - 32)[0].rstrip(b'\0'))
+
+    def leer(self, funcion: Callable):
+        """Ejecuta funcion(calculadora) sobre una vista consistente y sin copias del historial.
+
+        La calculadora recibida es de solo lectura y la función no debe retornar
+        referencias a sus registros compartidos (las vistas se liberan al terminar).
+        Los percentiles e histogramas usan los resúmenes publicados por el escritor.
+        """
+        while True:
+            if self._reubicado():
+                self._adjuntar()
+                continue
+            generacion, total = self._estado_estable()
+            if self._reubicado():
+                continue
+            vistas = {}
+            tipos = {}
+            enteros = {}
+            for nombre, tipo, offset in self._columnas:
+                ancho = 2 if tipo == _TEXTO else 8
+                formato = {_REAL: 'd', _FECHA: 'q', _TEXTO: 'H'}[tipo]
+                vistas[nombre] = self._segmento.buf[offset:offset + total * ancho].toreadonly().cast(formato)
+                tipos[nombre] = tipo
+                if tipo == _REAL:
+                    marcas = offset + self.capacidad * 8
+                    enteros[nombre] = self._segmento.buf[marcas:marcas + total].toreadonly()
+            calculadora = _CLASES[self.clase]()
+            setattr(calculadora, ATRIBUTOS_REGISTROS[self.clase],
+                    FilasCompartidas(vistas, tipos, self._diccionario, total, enteros))
+            calculadora.resumenes = self._resumenes
+            try:
+                resultado = funcion(calculadora)
+            except (IndexError, KeyError, ValueError):
+                # Lectura durante una reescritura: se reintenta si cambió la generación
+                if self._leer_campo(_GENERACION) == generacion:
+                    raise
+                continue
+            finally:
+                for vista in (*vistas.values(), *enteros.values()):
+                    vista.release()
+            if self._leer_campo(_GENERACION) == generacion:
+                return resultado
+
+    def consultar(self, metodo: str, *args, **kwargs):
+        """Atajo para leer(lambda calc: calc.metodo(*args, **kwargs))"""
+        return self.leer(lambda calculadora: getattr(calculadora, metodo)(*args, **kwargs))
+
+    def cerrar(self):
+        if self._segmento is not None:
+            self._segmento.close()
+            self._segmento = None
+        self._control.close()
@@ -0,0 +1,294 @@
+"""Prueba de resistencia: carga sostenida sobre las tres calculadoras.
+
+Uso: python -m hight_bod_heavy.resistencia --minutos 30 --tasa 1000 --calentamiento 60
+"""
+import argparse
+from dataclasses import dataclass, field
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .agregacion import percentil
+from .hight_bod_heavy import CalculadoraIMC, CalculadoraGrasaCorporal, CalculadoraMasaMuscular
+
+# Peso relativo de cada operación en la carga por defecto
+MEZCLA_POR_DEFECTO = {
+    'imc_encolar': 30, 'imc_procesar': 3, 'imc_agregar': 5, 'imc_estadisticas': 1, 'imc_percentiles': 1,
+    'grasa_encolar': 20, 'grasa_procesar': 2, 'grasa_agregar': 5, 'grasa_tendencia': 1,
+    'masa_encolar': 20, 'masa_procesar': 2, 'masa_agregar': 5, 'masa_progreso': 1,
+}
+
+
+@dataclass
+class ConfiguracionResistencia:
+    duracion_s: float = 60.0
+    tasa_por_segundo: float = 500.0  # Llegadas programadas (carga de lazo abierto)
+    mezcla: Dict[str, float] = field(default_factory=lambda: dict(MEZCLA_POR_DEFECTO))
+    intervalo_muestreo_s: float = 5.0
+    calentamiento_s: float = 0.0  # Muestras ignoradas al calcular pendientes
+    usar_tracemalloc: bool = True
+    top_asignaciones: int = 10
+    # Modelo de retención opcional: conserva solo los N registros más recientes de cada
+    # historial. None (por defecto) lo deja crecer, que es lo que la prueba debe detectar
+    maximo_registros: Optional[int] = None
+    # Presupuestos: None desactiva el control
+    crecimiento_memoria_max_mb_min: Optional[float] = 50.0
+    pendiente_p99_max_ms_min: Optional[float] = 1.0
+    semilla: Optional[int] = None
+
+
+@dataclass
+class ResultadoResistencia:
+    muestras: List[Dict]
+    operaciones: int
+    crecimiento_memoria_mb_min: float
+    pendiente_p99_ms_min: float
+    fallas: List[str]
+
+    @property
+    def aprobado(self) -> bool:
+        return not self.fallas
+
+
+def memoria_residente_bytes() -> int:
+    """RSS actual del proceso (0 si la plataforma no lo expone)"""
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss es el pico (KB en Linux, bytes en macOS): aproximación en otras plataformas
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo if sys.platform == 'darwin' else maximo * 1024
+
+
+def pendiente(puntos: Sequence[Tuple[float, float]]) -> float:
+    """Pendiente por mínimos cuadrados de (x, y); 0 con menos de dos puntos"""
+    if len(puntos) < 2:
+        return 0.0
+    media_x = sum(x for x, _ in puntos) / len(puntos)
+    media_y = sum(y for _, y in puntos) / len(puntos)
+    varianza = sum((x - media_x) ** 2 for x, _ in puntos)
+    if varianza == 0:
+        return 0.0
+    return sum((x - media_x) * (y - media_y) for x, y in puntos) / varianza
+
+
+def _crear_operaciones(aleatorio: random.Random,
+                       maximo_registros: Optional[int] = None) -> Dict[str, Callable[[], object]]:
+    calculadoras = {'imc': CalculadoraIMC(), 'grasa': CalculadoraGrasaCorporal(), 'masa': CalculadoraMasaMuscular()}
+    atributos = {'imc': 'historial_imc', 'grasa': 'registros_grasa', 'masa': 'composiciones'}
+
+    def retener(clave: str):
+        """Recorta el historial a los maximo_registros más recientes (modelo de retención).
+
+        Solo se recorta la lista de registros: colas, resúmenes y detectores se conservan.
+        """
+        if maximo_registros is None:
+            return
+        registros = getattr(calculadoras[clave], atributos[clave])
+        if len(registros) > maximo_registros:
+            del registros[:len(registros) - maximo_registros]
+
+    def escritura(clave: str, metodo: str, *generadores: Callable[[], object]) -> Callable[[], None]:
+        def operacion():
+            getattr(calculadoras[clave], metodo)(*(generador() for generador in generadores))
+            retener(clave)
+        return operacion
+
+    def lectura(clave: str, metodo: str) -> Callable[[], object]:
+        return lambda: getattr(calculadoras[clave], metodo)()
+
+    def peso():
+        return aleatorio.uniform(45, 130)
+
+    def altura():
+        return aleatorio.uniform(1.45, 2.0)
+
+    def imc():
+        return aleatorio.uniform(17, 40)
+
+    def edad():
+        return aleatorio.randint(18, 80)
+
+    def sexo():
+        return aleatorio.choice('MF')
+
+    def grasa():
+        return aleatorio.uniform(8, 45)
+
+    return {
+        'imc_encolar': escritura('imc', 'encolar_calculo', peso, altura),
+        'imc_procesar': escritura('imc', 'procesar_cola'),
+        'imc_agregar': escritura('imc', 'agregar_historial', peso, altura),
+        'imc_estadisticas': lectura('imc', 'obtener_estadisticas'),
+        'imc_percentiles': lectura('imc', 'obtener_percentiles'),
+        'grasa_encolar': escritura('grasa', 'encolar_calculo', imc, edad, sexo),
+        'grasa_procesar': escritura('grasa', 'procesar_cola'),
+        'grasa_agregar': escritura('grasa', 'agregar_registro', imc, edad, sexo),
+        'grasa_tendencia': lectura('grasa', 'obtener_tendencia_grasa'),
+        'masa_encolar': escritura('masa', 'encolar_analisis', peso, grasa),
+        'masa_procesar': escritura('masa', 'procesar_cola'),
+        'masa_agregar': escritura('masa', 'agregar_composicion', peso, grasa),
+        'masa_progreso': lectura('masa', 'obtener_progreso_muscular'),
+    }
+
+
+def _top_asignaciones(cantidad: int) -> List[Tuple[str, float]]:
+    estadisticas = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    )).statistics('lineno')
+    return [(f"{e.traceback[0].filename}:{e.traceback[0].lineno}", e.size / 1024)
+            for e in estadisticas[:cantidad]]
+
+
+def ejecutar(configuracion: ConfiguracionResistencia,
+             al_muestrear: Optional[Callable[[Dict], None]] = None) -> ResultadoResistencia:
+    """Ejecuta la carga y evalúa los presupuestos de memoria y latencia"""
+    if configuracion.tasa_por_segundo <= 0:
+        raise ValueError("La tasa debe ser mayor a cero")
+    if configuracion.maximo_registros is not None and configuracion.maximo_registros <= 0:
+        raise ValueError("maximo_registros debe ser mayor a cero (o None, sin retención)")
+    desconocidas = set(configuracion.mezcla) - set(MEZCLA_POR_DEFECTO)
+    if desconocidas:
+        raise ValueError(f"Operaciones desconocidas: {sorted(desconocidas)}")
+
+    aleatorio = random.Random(configuracion.semilla)
+    operaciones = _crear_operaciones(aleatorio, configuracion.maximo_registros)
+    nombres = list(configuracion.mezcla)
+    pesos = [configuracion.mezcla[nombre] for nombre in nombres]
+    intervalo_llegada = 1 / configuracion.tasa_por_segundo
+
+    iniciar_traza = configuracion.usar_tracemalloc and not tracemalloc.is_tracing()
+    if iniciar_traza:
+        tracemalloc.start()
+    gc.collect()
+
+    muestras = []
+    latencias = []
+    total = 0
+    inicio = time.perf_counter()
+    fin = inicio + configuracion.duracion_s
+    proxima_llegada = inicio
+    proxima_muestra = inicio + configuracion.intervalo_muestreo_s
+    try:
+        while True:
+            ahora = time.perf_counter()
+            if ahora >= proxima_muestra or ahora >= fin:
+                muestra = _muestrear(configuracion, ahora - inicio, latencias, total)
+                muestras.append(muestra)
+                if al_muestrear:
+                    al_muestrear(muestra)
+                latencias = []
+                # El tiempo de muestreo (snapshot de tracemalloc) no cuenta como atraso de la carga
+                proxima_llegada += time.perf_counter() - ahora
+                while proxima_muestra <= ahora:
+                    proxima_muestra += configuracion.intervalo_muestreo_s
+                if ahora >= fin:
+                    break
+                continue
+            if ahora < proxima_llegada:
+                time.sleep(min(proxima_llegada - ahora, proxima_muestra - ahora))
+                continue
+
+            nombre = aleatorio.choices(nombres, pesos)[0]
+            operaciones[nombre]()
+            # La latencia se mide desde la llegada programada: incluye la espera si hay atraso
+            latencias.append(time.perf_counter() - proxima_llegada)
+            proxima_llegada += intervalo_llegada
+            total += 1
+    finally:
+        if iniciar_traza:
+            tracemalloc.stop()
+
+    return _evaluar(configuracion, muestras, total)
+
+
+def _muestrear(configuracion: ConfiguracionResistencia, segundos: float, latencias: List[float],
+               total: int) -> Dict:
+    ordenadas = sorted(latencias)
+    muestra = {
+        'segundos': segundos,
+        'operaciones': total,
+        'operaciones_intervalo': len(latencias),
+        'p50_ms': percentil(ordenadas, 50) * 1000 if ordenadas else 0.0,
+        'p99_ms': percentil(ordenadas, 99) * 1000 if ordenadas else 0.0,
+        'rss_mb': memoria_residente_bytes() / 2 ** 20,
+    }
+    if configuracion.usar_tracemalloc:
+        muestra['memoria_trazada_mb'] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        muestra['top_asignaciones_kb'] = _top_asignaciones(configuracion.top_asignaciones)
+    return muestra
+
+
+def _evaluar(configuracion: ConfiguracionResistencia, muestras: List[Dict], total: int) -> ResultadoResistencia:
+    validas = [m for m in muestras if m['segundos'] >= configuracion.calentamiento_s and m['operaciones_intervalo']]
+    crecimiento = pendiente([(m['segundos'] / 60, m['rss_mb']) for m in validas])
+    pendiente_p99 = pendiente([(m['segundos'] / 60, m['p99_ms']) for m in validas])
+
+    fallas = []
+    maximo_memoria = configuracion.crecimiento_memoria_max_mb_min
+    if maximo_memoria is not None and crecimiento > maximo_memoria:
+        fallas.append(f"Crecimiento de memoria {crecimiento:.2f} MB/min > {maximo_memoria} MB/min")
+    maximo_p99 = configuracion.pendiente_p99_max_ms_min
+    if maximo_p99 is not None and pendiente_p99 > maximo_p99:
+        fallas.append(f"Pendiente de p99 {pendiente_p99:.3f} ms/min > {maximo_p99} ms/min")
+    return ResultadoResistencia(muestras, total, crecimiento, pendiente_p99, fallas)
+
+
+def _imprimir_muestra(muestra: Dict):
+    linea = (f"[{muestra['segundos']:8.1f}s] ops={muestra['operaciones']:>9} "
+             f"p50={muestra['p50_ms']:.3f}ms p99={muestra['p99_ms']:.3f}ms rss={muestra['rss_mb']:.1f}MB")
+    if 'memoria_trazada_mb' in muestra:
+        linea += f" trazada={muestra['memoria_trazada_mb']:.1f}MB"
+    print(linea)
+    for ubicacion, kb in muestra.get('top_asignaciones_kb', [])[:3]:
+        print(f"    {kb:10.1f} KB  {ubicacion}")
+
+
+def main(argumentos: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de resistencia de hight_bod_heavy")
+    parser.add_argument('--minutos', type=float, default=1.0)
+    parser.add_argument('--tasa', type=float, default=500.0, help="Operaciones por segundo")
+    parser.add_argument('--intervalo', type=float, default=5.0, help="Segundos entre muestras")
+    parser.add_argument('--calentamiento', type=float, default=0.0, help="Segundos ignorados al evaluar")
+    parser.add_argument('--max-memoria-mb-min', type=float, default=50.0)
+    parser.add_argument('--max-p99-ms-min', type=float, default=1.0)
+    parser.add_argument('--maximo-registros', type=int,
+                        help="Modelo de retención: conserva solo los N registros más recientes "
+                             "(por defecto los historiales crecen sin límite)")
+    parser.add_argument('--sin-tracemalloc', action='store_true')
+    parser.add_argument('--semilla', type=int)
+    opciones = parser.parse_args(argumentos)
+
+    configuracion = ConfiguracionResistencia(
+        duracion_s=opciones.minutos * 60,
+        tasa_por_segundo=opciones.tasa,
+        intervalo_muestreo_s=opciones.intervalo,
+        calentamiento_s=opciones.calentamiento,
+        usar_tracemalloc=not opciones.sin_tracemalloc,
+        maximo_registros=opciones.maximo_registros,
+        crecimiento_memoria_max_mb_min=opciones.max_memoria_mb_min,
+        pendiente_p99_max_ms_min=opciones.max_p99_ms_min,
+        semilla=opciones.semilla,
+    )
+    resultado = ejecutar(configuracion, _imprimir_muestra)
+    print(f"Operaciones: {resultado.operaciones}")
+    print(f"Crecimiento de memoria: {resultado.crecimiento_memoria_mb_min:.2f} MB/min")
+    print(f"Pendiente de p99: {resultado.pendiente_p99_ms_min:.3f} ms/min")
+    for falla in resultado.fallas:
+        print(f"FALLA: {falla}")
+    return 0 if resultado.aprobado else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+from bisect import bisect_left
+from collections import Counter
+from itertools import repeat
+import math
+import operator
+import random
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class ResumenCuantiles:
+    """Resumen de cuantiles KLL: mergeable, serializable y de memoria acotada.
+
+    Guarda como mucho O(k log(n/k)) valores (más un búfer de k en el nivel 0);
+    el error de rango es de orden 1/k.
+    """
+
+    _CABECERA = struct.Struct('<IQddI')
+
+    def __init__(self, k: int = 200, semilla: Optional[int] = None):
+        if k < 8:
+            raise ValueError("k debe ser al menos 8")
+        self.k = k
+        self.total = 0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.compactores = []  # compactores[h] guarda valores de peso 2**h
+        self._aleatorio = random.Random(semilla)
+        self._capacidad_total = 0
+        self._tamano = 0  # Valores guardados entre todos los compactores
+        self._crecer()
+
+    def _capacidad(self, nivel: int) -> int:
+        altura = len(self.compactores) - nivel - 1
+        return int(math.ceil((2 / 3) ** altura * self.k)) + 1
+
+    def _crecer(self):
+        self.compactores.append([])
+        self._capacidad_total = sum(self._capacidad(h) for h in range(len(self.compactores)))
+
+    def _comprimir(self):
+        for nivel, compactor in enumerate(self.compactores):
+            if len(compactor) >= self._capacidad(nivel):
+                if nivel + 1 >= len(self.compactores):
+                    self._crecer()
+                compactor.sort()
+                sobrante = compactor.pop() if len(compactor) % 2 else None
+                desplazamiento = self._aleatorio.randint(0, 1)
+                self.compactores[nivel + 1].extend(compactor[desplazamiento::2])
+                self._tamano -= len(compactor) // 2
+                compactor.clear()
+                if sobrante is not None:
+                    compactor.append(sobrante)
+                return
+
+    def agregar(self, valor: float):
+        """Agrega un valor al resumen"""
+        self.compactores[0].append(valor)
+        self.total += 1
+        self._tamano += 1
+        if valor < self.minimo:
+            self.minimo = valor
+        if valor > self.maximo:
+            self.maximo = valor
+        # Se deja crecer el nivel 0 hasta k valores de más y se compacta en lote:
+        # compactar apenas se llena el presupuesto liberaría un valor por vez
+        if self._tamano >= self._capacidad_total + self.k:
+            while self._tamano >= self._capacidad_total:
+                self._comprimir()
+
+    def extender(self, valores: Sequence[float]):
+        """Agrega varios valores de una vez"""
+        if not valores:
+            return
+        self.compactores[0].extend(valores)
+        self.total += len(valores)
+        self._tamano += len(valores)
+        self.minimo = min(self.minimo, min(valores))
+        self.maximo = max(self.maximo, max(valores))
+        while self._tamano >= self._capacidad_total:
+            self._comprimir()
+
+    def combinar(self, otro: 'ResumenCuantiles'):
+        """Incorpora otro resumen (por ejemplo, el de otro proceso)"""
+        while len(self.compactores) < len(otro.compactores):
+            self._crecer()
+        for nivel, compactor in enumerate(otro.compactores):
+            self.compactores[nivel].extend(compactor)
+        self._tamano += otro._tamano
+        self.total += otro.total
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        while self._tamano >= self._capacidad_total:
+            self._comprimir()
+
+    def cuantil(self, q: float) -> float:
+        """Valor aproximado del cuantil q (entre 0 y 1)"""
+        if self.total == 0:
+            raise ValueError("El resumen está vacío")
+        if q < 0 or q > 1:
+            raise ValueError("El cuantil debe estar entre 0 y 1")
+        if q == 0:
+            return self.minimo
+        if q == 1:
+            return self.maximo
+        ponderados = sorted((valor, 1 << nivel)
+                            for nivel, compactor in enumerate(self.compactores)
+                            for valor in compactor)
+        peso_total = sum(peso for _, peso in ponderados)
+        objetivo = q * peso_total
+        acumulado = 0
+        for valor, peso in ponderados:
+            acumulado += peso
+            if acumulado >= objetivo:
+                return valor
+        return self.maximo
+
+    def percentiles(self, percentiles: Sequence[float] = (5, 50, 95)) -> Dict[float, float]:
+        """Retorna {percentil: valor} para percentiles entre 0 y 100 ({} si está vacío)"""
+        if self.total == 0:
+            return {}
+        return {p: self.cuantil(p / 100) for p in percentiles}
+
+    def a_bytes(self) -> bytes:
+        """Serializa el resumen en formato binario compacto"""
+        partes = [self._CABECERA.pack(self.k, self.total, self.minimo, self.maximo, len(self.compactores))]
+        for compactor in self.compactores:
+            partes.append(struct.pack(f'<I{len(compactor)}d', len(compactor), *compactor))
+        return b''.join(partes)
+
+    @classmethod
+    def desde_bytes(cls, datos: bytes) -> 'ResumenCuantiles':
+        """Reconstruye un resumen serializado con a_bytes"""
+        k, total, minimo, maximo, niveles = cls._CABECERA.unpack_from(datos, 0)
+        resumen = cls(k)
+        resumen.total, resumen.minimo, resumen.maximo = total, minimo, maximo
+        resumen.compactores = []
+        posicion = cls._CABECERA.size
+        for _ in range(niveles):
+            (cantidad,) = struct.unpack_from('<I', datos, posicion)
+            posicion += 4
+            resumen.compactores.append(list(struct.unpack_from(f'<{cantidad}d', datos, posicion)))
+            posicion += 8 * cantidad
+        resumen._capacidad_total = sum(resumen._capacidad(h) for h in range(niveles))
+        resumen._tamano = sum(len(compactor) for compactor in resumen.compactores)
+        return resumen
+
+
+class HistogramaFijo:
+    """Histograma de bins de ancho fijo. Los valores fuera de rango van a desbordes"""
+
+    _CABECERA = struct.Struct('<ddIQQ')
+
+    def __init__(self, inicio: float, fin: float, cantidad: int):
+        if cantidad <= 0 or fin <= inicio:
+            raise ValueError("Bins no válidos")
+        self.inicio = inicio
+        self.fin = fin
+        self.cantidad = cantidad
+        self.ancho = (fin - inicio) / cantidad
+        self.conteos = [0] * cantidad
+        self.por_debajo = 0
+        self.por_encima = 0
+
+    def agregar(self, valor: float):
+        """Agrega un valor al histograma"""
+        if valor < self.inicio:
+            self.por_debajo += 1
+        elif valor >= self.fin:
+            self.por_encima += 1
+        else:
+            self.conteos[min(int((valor - self.inicio) // self.ancho), self.cantidad - 1)] += 1
+
+    def extender(self, valores: Sequence[float]):
+        """Agrega varios valores de una vez (mismos bins que agregar, sin recorrerlos en Python)"""
+        por_encima = sum(map(operator.ge, valores, repeat(self.fin)))
+        desplazados = map(operator.sub, valores, repeat(self.inicio))
+        indices = Counter(map(int, map(operator.floordiv, desplazados, repeat(self.ancho))))
+        ultimo = self.cantidad - 1
+        for indice, cantidad in indices.items():
+            if indice < 0:
+                self.por_debajo += cantidad
+            elif indice >= ultimo:  # Incluye los valores >= fin, que se descuentan abajo
+                self.conteos[ultimo] += cantidad
+            else:
+                self.conteos[indice] += cantidad
+        self.conteos[ultimo] -= por_encima
+        self.por_encima += por_encima
+
+    def extender_ordenados(self, valores: Sequence[float]):
+        """Como extender, para valores ya ordenados: busca el borde de cada bin"""
+        desde = bisect_left(valores, self.inicio)
+        hasta = bisect_left(valores, self.fin)
+        self.por_debajo += desde
+        self.por_encima += len(valores) - hasta
+        for indice in range(self.cantidad - 1):
+            # Primer valor cuyo bin (calculado igual que en agregar) es posterior a indice
+            bajo, alto = desde, hasta
+            while bajo < alto:
+                medio = (bajo + alto) // 2
+                if (valores[medio] - self.inicio) // self.ancho > indice:
+                    alto = medio
+                else:
+                    bajo = medio + 1
+            self.conteos[indice] += bajo - desde
+            desde = bajo
+        self.conteos[-1] += hasta - desde
+
+    def combinar(self, otro: 'HistogramaFijo'):
+        """Suma los conteos de otro histograma con los mismos bins"""
+        if (self.inicio, self.fin, self.cantidad) != (otro.inicio, otro.fin, otro.cantidad):
+            raise ValueError("Los histogramas deben tener los mismos bins")
+        self.conteos = [a + b for a, b in zip(self.conteos, otro.conteos)]
+        self.por_debajo += otro.por_debajo
+        self.por_encima += otro.por_encima
+
+    def limites(self) -> List[float]:
+        return [self.inicio + self.ancho * i for i in range(self.cantidad + 1)]
+
+    def a_dict(self) -> Dict:
+        return {
+            'limites': self.limites(),
+            'conteos': list(self.conteos),
+            'por_debajo': self.por_debajo,
+            'por_encima': self.por_encima
+        }
+
+    def a_bytes(self) -> bytes:
+        """Serializa el histograma en formato binario compacto"""
+        return (self._CABECERA.pack(self.inicio, self.fin, self.cantidad, self.por_debajo, self.por_encima)
+                + struct.pack(f'<{self.cantidad}Q', *self.conteos))
+
+    @classmethod
+    def desde_bytes(cls, datos: bytes) -> 'HistogramaFijo':
+        """Reconstruye un histograma serializado con a_bytes"""
+        inicio, fin, cantidad, por_debajo, por_encima = cls._CABECERA.unpack_from(datos, 0)
+        histograma = cls(inicio, fin, cantidad)
+        histograma.por_debajo, histograma.por_encima = por_debajo, por_encima
+        histograma.conteos = list(struct.unpack_from(f'<{cantidad}Q', datos, cls._CABECERA.size))
+        return histograma
+
+
+class ResumenesPoblacion:
+    """Resúmenes incrementales (cuantiles e histograma) para varias columnas.
+
+    Los registros se acumulan en lotes de k y se vuelcan a los resúmenes al llenarse
+    el lote o al consultar, para que actualizar sea un solo append.
+    """
+
+    def __init__(self, columnas: Dict[str, Tuple[float, float, int]], k: int = 200):
+        self.columnas = dict(columnas)
+        self.k = k
+        self.limpiar()
+
+    def limpiar(self):
+        self._cuantiles = {nombre: ResumenCuantiles(self.k) for nombre in self.columnas}
+        self._histogramas = {nombre: HistogramaFijo(*bins) for nombre, bins in self.columnas.items()}
+        self._pendientes = []
+        self._columnas_pendientes = []
+
+    @property
+    def cuantiles(self) -> Dict[str, ResumenCuantiles]:
+        self._volcar()
+        return self._cuantiles
+
+    @property
+    def histogramas(self) -> Dict[str, HistogramaFijo]:
+        self._volcar()
+        return self._histogramas
+
+    def _volcar(self):
+        for columnas in self._columnas_pendientes:
+            for nombre in self.columnas:
+                # Un solo ordenamiento sirve al histograma y a la compactación del resumen
+                valores = sorted(columnas[nombre])
+                self._histogramas[nombre].extender_ordenados(valores)
+                self._cuantiles[nombre].extender(valores)
+        self._columnas_pendientes.clear()
+        if not self._pendientes:
+            return
+        for nombre in self.columnas:
+            valores = [registro[nombre] for registro in self._pendientes]
+            self._cuantiles[nombre].extender(valores)
+            self._histogramas[nombre].extender(valores)
+        self._pendientes.clear()
+
+    def actualizar(self, registro: Dict):
+        """Agrega a cada resumen el valor correspondiente del registro"""
+        self._pendientes.append(registro)
+        if len(self._pendientes) >= self.k:
+            self._volcar()
+
+    def extender(self, columnas: Dict[str, Sequence[float]]):
+        """Agrega columnas completas de valores (por ejemplo, al restaurar una instantánea).
+
+        Como los registros de actualizar, se vuelcan recién al consultar los resúmenes.
+        """
+        self._columnas_pendientes.append({nombre: columnas[nombre] for nombre in self.columnas})
+
+    def combinar(self, otro: 'ResumenesPoblacion'):
+        """Incorpora los resúmenes de otro proceso o shard"""
+        if self.columnas != otro.columnas:
+            raise ValueError("Los resúmenes deben cubrir las mismas columnas y bins")
+        for nombre in self.columnas:
+            self.cuantiles[nombre].combinar(otro.cuantiles[nombre])
+            self.histogramas[nombre].combinar(otro.histogramas[nombre])
+
+    def _validar_columna(self, columna: str):
+        if columna not in self.columnas:
+            raise ValueError(f"No hay resumen para la columna '{columna}'")
+
+    def percentiles(self, columna: str, percentiles: Sequence[float] = (5, 50, 95)) -> Dict[float, float]:
+        self._validar_columna(columna)
+        return self.cuantiles[columna].percentiles(percentiles)
+
+    def histograma(self, columna: str) -> Dict:
+        self._validar_columna(columna)
+        return self.histogramas[columna].a_dict()
+
+    def a_bytes(self) -> bytes:
+        """Serializa todos los resúmenes (sin filas) para enviarlos a otro proceso"""
+        partes = [struct.pack('<II', self.k, len(self.columnas))]
+        for nombre in self.columnas:
+            nombre_bytes = nombre.encode('utf-8')
+            cuantiles = self.cuantiles[nombre].a_bytes()
+            histograma = self.histogramas[nombre].a_bytes()
+            partes.append(struct.pack('<HII', len(nombre_bytes), len(cuantiles), len(histograma)))
+            partes.extend([nombre_bytes, cuantiles, histograma])
+        return b''.join(partes)
+
+    @classmethod
+    def desde_bytes(cls, datos: bytes) -> 'ResumenesPoblacion':
+        """Reconstruye los resúmenes serializados con a_bytes"""
+        k, cantidad = struct.unpack_from('<II', datos, 0)
+        posicion = 8
+        cuantiles, histogramas = {}, {}
+        for _ in range(cantidad):
+            largo_nombre, largo_cuantiles, largo_histograma = struct.unpack_from('<HII', datos, posicion)
+            posicion += 10
+            nombre = datos[posicion:posicion + largo_nombre].decode('utf-8')
+            posicion += largo_nombre
+            cuantiles[nombre] = ResumenCuantiles.desde_bytes(datos[posicion:posicion + largo_cuantiles])
+            posicion += largo_cuantiles
+            histogramas[nombre] = HistogramaFijo.desde_bytes(datos[posicion:posicion + largo_histograma])
+            posicion += largo_histograma
+        resumenes = cls({nombre: (h.inicio, h.fin, h.cantidad) for nombre, h in histogramas.items()}, k)
+        resumenes._cuantiles, resumenes._histogramas = cuantiles, histogramas
+        return resumenes
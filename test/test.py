@@ -1,4 +1,14 @@
 from hight_bod_heavy import CalculadoraIMC, CalculadoraGrasaCorporal, CalculadoraMasaMuscular
+from hight_bod_heavy import MotorAgrupacion, ResumenCuantiles, HistogramaFijo, ResumenesPoblacion
+import random
+import logging
+import pickle
+import struct
+from datetime import timedelta
+import multiprocessing
+from hight_bod_heavy import PublicadorMemoria, ReplicaLectura
+from hight_bod_heavy import replicas
+from hight_bod_heavy.resistencia import ConfiguracionResistencia, ejecutar, _crear_operaciones
 import time
 import sys
 
@@ -339,6 +349,669 @@ def test_integracion_completa():
     print(f"\n Integración: {tests_pasados}/{total_tests} pruebas exitosas")
     return tests_pasados, total_tests
 
+def test_agrupacion():
+    """Pruebas del motor de agrupación"""
+    print("\n" + "="*60)
+    print("TEST AGRUPACIÓN")
+    print("="*60)
+    
+    calc = CalculadoraGrasaCorporal()
+    tests_pasados = 0
+    total_tests = 0
+    
+    for i in range(200):
+        calc.agregar_registro(20 + (i % 15), 18 + (i % 50), 'M' if i % 2 == 0 else 'F')
+    
+    # Test 1: Promedio por edad coincide con el cálculo directo
+    try:
+        promedios = calc.obtener_promedio_por_edad()
+        veintes = [r['porcentaje_grasa'] for r in calc.registros_grasa if 20 <= r['edad'] < 30]
+        assert abs(promedios[20] - sum(veintes) / len(veintes)) < 1e-9
+        print(f" Promedio por edad: {len(promedios)} décadas")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Promedio por edad falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Varias claves y agregados
+    try:
+        grupos = calc.agrupar(['decada', 'sexo'], agregados=('conteo', 'media', 'desviacion', 'p50', 'p95'))
+        assert sum(g['conteo'] for g in grupos.values()) == 200
+        assert all(g['p50'] <= g['p95'] for g in grupos.values())
+        por_categoria = calc.agrupar('categoria_grasa', agregados=('conteo',))
+        assert sum(g['conteo'] for g in por_categoria.values()) == 200
+        print(f" Agrupación múltiple: {len(grupos)} grupos, {len(por_categoria)} categorías")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Agrupación múltiple falló: {e}")
+    total_tests += 1
+    
+    # Test 3: Histograma y agregación paralela
+    try:
+        motor = MotorAgrupacion(calc.obtener_columnas())
+        secuencial = motor.agrupar('sexo', 'porcentaje_grasa', ('conteo', 'media', 'desviacion', 'histograma'),
+                                   bins=(10, 30, 4))
+        paralelo = motor.agrupar('sexo', 'porcentaje_grasa', ('conteo', 'media', 'desviacion', 'histograma'),
+                                 bins=(10, 30, 4), procesos=2, tamano_bloque=50)
+        for sexo in ('M', 'F'):
+            histograma = secuencial[sexo]['histograma']
+            # Los valores fuera de rango no se acumulan en los bins de los extremos
+            assert histograma['por_debajo'] + histograma['por_encima'] > 0
+            assert sum(histograma['conteos']) + histograma['por_debajo'] + histograma['por_encima'] == \
+                secuencial[sexo]['conteo']
+            assert secuencial[sexo]['conteo'] == paralelo[sexo]['conteo']
+            assert abs(secuencial[sexo]['desviacion'] - paralelo[sexo]['desviacion']) < 1e-9
+            assert secuencial[sexo]['histograma'] == paralelo[sexo]['histograma']
+        print(" Histograma y agregación paralela consistentes")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Histograma/paralelo falló: {e}")
+    total_tests += 1
+    
+    # Test 4: Agrupación por mes y categoría de IMC
+    try:
+        calc_imc = CalculadoraIMC()
+        for i in range(20):
+            calc_imc.agregar_historial(55 + i * 3, 1.70)
+        por_mes = calc_imc.agrupar('mes', agregados=('conteo',))
+        assert sum(g['conteo'] for g in por_mes.values()) == 20
+        por_categoria = calc_imc.agrupar('categoria_imc', agregados=('conteo', 'minimo', 'maximo'))
+        assert 'Peso normal' in por_categoria
+        print(f" Agrupación IMC: {len(por_categoria)} categorías")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Agrupación IMC falló: {e}")
+    total_tests += 1
+    
+    print(f"\n Agrupación: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def test_resumenes():
+    """Pruebas de resúmenes de cuantiles e histogramas"""
+    print("\n" + "="*60)
+    print("TEST RESÚMENES")
+    print("="*60)
+    
+    tests_pasados = 0
+    total_tests = 0
+    aleatorio = random.Random(7)
+    valores = [aleatorio.gauss(25, 4) for _ in range(20000)]
+    ordenados = sorted(valores)
+    
+    # Test 1: Precisión del resumen de cuantiles
+    try:
+        resumen = ResumenCuantiles(semilla=1)
+        for valor in valores:
+            resumen.agregar(valor)
+        for q in (0.05, 0.5, 0.95):
+            estimado = resumen.cuantil(q)
+            rango = sum(1 for v in ordenados if v <= estimado) / len(ordenados)
+            assert abs(rango - q) < 0.02, f"q={q}, rango={rango}"
+        tamano = sum(len(c) for c in resumen.compactores)
+        assert tamano < 1000
+        # Agregar por lotes da el mismo total e histograma que de a uno
+        por_lotes, histograma, histograma_lotes = ResumenCuantiles(semilla=1), HistogramaFijo(15, 35, 20), \
+            HistogramaFijo(15, 35, 20)
+        for inicio in range(0, len(valores), 300):
+            por_lotes.extender(valores[inicio:inicio + 300])
+            histograma_lotes.extender(valores[inicio:inicio + 300])
+        for valor in valores:
+            histograma.agregar(valor)
+        assert por_lotes.total == resumen.total and por_lotes.minimo == resumen.minimo
+        assert abs(por_lotes.cuantil(0.5) - resumen.cuantil(0.5)) < 0.5
+        assert histograma_lotes.a_dict() == histograma.a_dict()
+        histograma_ordenado = HistogramaFijo(15, 35, 20)
+        histograma_ordenado.extender_ordenados(sorted(valores))
+        assert histograma_ordenado.a_dict() == histograma.a_dict()
+        print(f" Cuantiles aproximados con {tamano} valores guardados")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Precisión de cuantiles falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Combinación y serialización
+    try:
+        mitad_a, mitad_b = ResumenCuantiles(semilla=2), ResumenCuantiles(semilla=3)
+        for i, valor in enumerate(valores):
+            (mitad_a if i % 2 else mitad_b).agregar(valor)
+        recibido = ResumenCuantiles.desde_bytes(mitad_b.a_bytes())
+        assert recibido.percentiles() == mitad_b.percentiles()
+        mitad_a.combinar(recibido)
+        assert mitad_a.total == len(valores)
+        rango = sum(1 for v in ordenados if v <= mitad_a.cuantil(0.5)) / len(ordenados)
+        assert abs(rango - 0.5) < 0.02
+        print(" Combinación y serialización de resúmenes")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Combinación/serialización falló: {e}")
+    total_tests += 1
+    
+    # Test 3: Resúmenes mantenidos por las calculadoras
+    try:
+        calc_imc = CalculadoraIMC()
+        calc_otro = CalculadoraIMC()
+        for i in range(300):
+            calc_imc.agregar_historial(50 + i % 60, 1.70)
+            calc_otro.encolar_calculo(60 + i % 40, 1.80)
+        calc_otro.procesar_cola()
+        percentiles = calc_imc.obtener_percentiles()
+        assert percentiles[5] <= percentiles[50] <= percentiles[95]
+        histograma = calc_imc.obtener_histograma()
+        assert sum(histograma['conteos']) + histograma['por_debajo'] + histograma['por_encima'] == 300
+        
+        central = ResumenesPoblacion.desde_bytes(calc_imc.resumenes.a_bytes())
+        central.combinar(ResumenesPoblacion.desde_bytes(calc_otro.resumenes.a_bytes()))
+        assert central.cuantiles['imc'].total == 600
+        
+        calc_imc.limpiar_historial(confirmacion=True)
+        assert calc_imc.resumenes.cuantiles['imc'].total == 0
+        assert calc_imc.obtener_percentiles() == {}
+        print(f" Percentiles IMC: p5={percentiles[5]:.1f}, p50={percentiles[50]:.1f}, p95={percentiles[95]:.1f}")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Resúmenes de calculadoras fallaron: {e}")
+    total_tests += 1
+    
+    print(f"\n Resúmenes: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def test_escenarios():
+    """Pruebas de simulación de escenarios de composición"""
+    print("\n" + "="*60)
+    print("TEST ESCENARIOS")
+    print("="*60)
+    
+    calc = CalculadoraMasaMuscular()
+    calc.agregar_composicion(90, 30)
+    tests_pasados = 0
+    total_tests = 0
+    
+    # Test 1: La grilla coincide con calcular_deficit_calorico
+    try:
+        pesos = [75, 80, 85]
+        porcentajes = [18, 20, 25]
+        semanas = [8, 12, 24]
+        escenarios = calc.simular_escenarios(pesos, porcentajes, semanas, grilla=True)
+        assert len(escenarios['es_saludable']) == 27
+        for i in range(27):
+            individual = calc.calcular_deficit_calorico(escenarios['peso_objetivo'][i],
+                                                        escenarios['porcentaje_grasa_objetivo'][i],
+                                                        int(escenarios['semanas'][i]))
+            assert abs(individual['deficit_calorico_diario'] - escenarios['deficit_calorico_diario'][i]) < 1e-6
+            assert individual['es_saludable'] == escenarios['es_saludable'][i]
+        print(f" Grilla de {len(escenarios['es_saludable'])} escenarios consistente")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Grilla de escenarios falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Secuencias en paralelo con varios usuarios
+    try:
+        escenarios = calc.simular_escenarios([70, 80], 20, 10, grasa_actual_kg=[20, 30])
+        assert abs(escenarios['grasa_a_perder_kg'][0] - 6.0) < 1e-9
+        assert abs(escenarios['grasa_a_perder_kg'][1] - 14.0) < 1e-9
+        assert escenarios['es_saludable'] == [True, False]
+        # En grilla, cada usuario recibe la grilla completa
+        grilla = calc.simular_escenarios([70, 80], [15, 20], 10, grilla=True, grasa_actual_kg=[20, 30, 40])
+        assert len(grilla['es_saludable']) == 12
+        assert list(grilla['grasa_actual_kg']) == [20] * 4 + [30] * 4 + [40] * 4
+        assert abs(grilla['grasa_a_perder_kg'][6] - (30 - 80 * 0.15)) < 1e-9
+        # Columnas nuevas y con tipos uniformes, sin compartir las secuencias del llamador
+        pesos = [80, 75]
+        escenarios = calc.simular_escenarios(pesos, 20)
+        escenarios['peso_objetivo'][0] = 1
+        assert pesos == [80, 75]
+        assert escenarios['porcentaje_grasa_objetivo'].typecode == 'd'
+        assert grilla['semanas'].typecode == 'q' and grilla['semanas'][0] == 10
+        sin_datos = CalculadoraMasaMuscular().simular_escenarios([70], [20])
+        assert 'error' in sin_datos
+        print(" Escenarios por usuario")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Escenarios por usuario fallaron: {e}")
+    total_tests += 1
+    
+    # Test 3: Plan saludable más corto para muchos usuarios
+    try:
+        grasas = [20 + (i % 15) for i in range(3000)]
+        planes = CalculadoraMasaMuscular.planes_saludables_mas_cortos(grasas, 70, 15, semanas_maximas=20)
+        for i in (0, 7, 14):
+            if planes['es_alcanzable'][i]:
+                semanas = planes['semanas'][i]
+                assert planes['perdida_semanal_kg'][i] <= CalculadoraMasaMuscular.PERDIDA_SEMANAL_MAXIMA_KG
+                assert semanas == 1 or planes['grasa_a_perder_kg'][i] / (semanas - 1) > 1.0
+        assert not planes['es_alcanzable'][14]
+        print(f" Planes más cortos para {len(planes['semanas'])} usuarios")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Planes más cortos fallaron: {e}")
+    total_tests += 1
+    
+    print(f"\n Escenarios: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def test_instantaneas():
+    """Pruebas de snapshot y restauración de estado"""
+    print("\n" + "="*60)
+    print("TEST INSTANTÁNEAS")
+    print("="*60)
+    
+    tests_pasados = 0
+    total_tests = 0
+    
+    # Test 1: Restauración completa con cola pendiente y compresión
+    try:
+        origen = CalculadoraGrasaCorporal()
+        for i in range(1000):
+            origen.agregar_registro(20 + (i % 15) * 0.7, 20 + (i % 50), 'M' if i % 3 else 'F')
+        origen.encolar_calculo(28.0, 35, 'M')
+        for compresion in (None, 'zlib', 'lzma'):
+            datos = origen.snapshot(compresion=compresion, nivel=6)
+            destino = CalculadoraGrasaCorporal()
+            destino.restaurar(datos)
+            assert destino.registros_grasa == origen.registros_grasa
+            assert list(destino.cola_grasa) == list(origen.cola_grasa)
+            assert destino.resumenes.cuantiles['porcentaje_grasa'].total == 1000
+            assert destino.resumenes.histograma('imc') == origen.resumenes.histograma('imc')
+        crudo = len(pickle.dumps(origen.registros_grasa))
+        print(f" Restauración completa: {len(origen.snapshot())} bytes "
+              f"({len(origen.snapshot(compresion='zlib'))} con zlib) vs {crudo} con pickle")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Restauración completa falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Snapshots incrementales
+    try:
+        origen = CalculadoraIMC()
+        destino = CalculadoraIMC()
+        for i in range(100):
+            origen.agregar_historial(60 + i % 30, 1.70)
+        destino.restaurar(origen.snapshot())
+        for i in range(5):
+            origen.agregar_historial(80, 1.75)
+        origen.encolar_calculo(90, 1.80)
+        delta = origen.snapshot(delta=True, compresion='zlib')
+        destino.restaurar(delta)
+        assert destino.historial_imc == origen.historial_imc
+        assert len(destino.cola_imc) == 1
+        try:
+            destino.restaurar(delta)
+            assert False, "Un delta repetido debería fallar"
+        except ValueError:
+            pass
+        print(f" Delta de {len(delta)} bytes aplicado")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Snapshots incrementales fallaron: {e}")
+    total_tests += 1
+    
+    # Test 3: Validación de tipo de calculadora
+    try:
+        origen = CalculadoraMasaMuscular()
+        origen.agregar_composicion(80, 20)
+        origen.encolar_analisis(79, 19.5)
+        destino = CalculadoraMasaMuscular()
+        destino.restaurar(origen.snapshot(compresion='lzma'))
+        assert destino.composiciones == origen.composiciones
+        # Los tipos declarados se conservan aunque una columna mezcle int y float
+        mixta = CalculadoraGrasaCorporal()
+        mixta.agregar_registro(25, 30, 'M')
+        mixta.agregar_registro(26.5, 31.5, 'F')
+        mixta.encolar_calculo(27, 40, 'M')
+        restaurada = CalculadoraGrasaCorporal()
+        restaurada.restaurar(mixta.snapshot())
+        assert [type(r['edad']) for r in restaurada.registros_grasa] == [int, float]
+        assert [type(r['imc']) for r in restaurada.registros_grasa] == [int, float]
+        assert type(restaurada.cola_grasa[0]['edad']) is int
+        try:
+            CalculadoraIMC().restaurar(origen.snapshot())
+            assert False, "Debería rechazar otra calculadora"
+        except ValueError:
+            pass
+        corrupta = bytearray(origen.snapshot(compresion='zlib'))
+        corrupta[4] = 9  # Byte de compresión
+        try:
+            CalculadoraMasaMuscular().restaurar(bytes(corrupta))
+            assert False, "Debería rechazar una compresión desconocida"
+        except ValueError:
+            pass
+        print(" Validación de tipo de calculadora")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Validación de tipo falló: {e}")
+    total_tests += 1
+    
+    print(f"\n Instantáneas: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def test_transiciones():
+    """Pruebas de eventos de transición de clasificación"""
+    print("\n" + "="*60)
+    print("TEST TRANSICIONES")
+    print("="*60)
+    
+    tests_pasados = 0
+    total_tests = 0
+    
+    # Test 1: Eventos por callback, incluida la cola de procesamiento
+    try:
+        calc = CalculadoraIMC()
+        eventos = []
+        calc.transiciones.suscribir(eventos.append)
+        calc.agregar_historial(85, 1.75)   # Sobrepeso
+        calc.agregar_historial(86, 1.75)   # Sobrepeso
+        calc.encolar_calculo(95, 1.75)     # Obesidad grado I
+        calc.encolar_calculo(80, 1.75)     # Sobrepeso
+        calc.procesar_cola()
+        assert [(e.anterior, e.nueva) for e in eventos] == [
+            ("Sobrepeso", "Obesidad grado I"), ("Obesidad grado I", "Sobrepeso")]
+        assert eventos[0].categoria == 'imc'
+        print(f" {len(eventos)} transiciones detectadas")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Transiciones por callback fallaron: {e}")
+    total_tests += 1
+    
+    # Test 2: Cola de eventos y confirmaciones (antirrebote)
+    try:
+        calc = CalculadoraGrasaCorporal()
+        calc.transiciones.confirmaciones = 2
+        cola = calc.transiciones.crear_cola()
+        calc.agregar_registro(25.5, 25, 'M')   # Fitness
+        calc.agregar_registro(29.6, 25, 'M')   # Aceptable (sin confirmar)
+        calc.agregar_registro(25.5, 25, 'M')   # Fitness
+        assert cola.empty()
+        calc.agregar_registro(29.6, 25, 'M')
+        calc.agregar_registro(29.8, 25, 'M')   # Aceptable confirmado
+        evento = cola.get_nowait()
+        assert (evento.anterior, evento.nueva) == ("Fitness", "Aceptable")
+        assert cola.empty()
+        print(f" Evento confirmado: {evento.anterior} -> {evento.nueva}")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Cola/antirrebote falló: {e}")
+    total_tests += 1
+    
+    # Test 3: Intervalo mínimo y restauración sin eventos
+    try:
+        calc = CalculadoraIMC()
+        calc.transiciones.intervalo_minimo = timedelta(hours=1)
+        eventos = []
+        calc.transiciones.suscribir(eventos.append)
+        calc.agregar_historial(70, 1.75)
+        calc.agregar_historial(85, 1.75)
+        calc.agregar_historial(70, 1.75)
+        assert len(eventos) == 1
+        
+        copia = CalculadoraIMC()
+        eventos_copia = []
+        copia.transiciones.suscribir(eventos_copia.append)
+        copia.restaurar(calc.snapshot())
+        assert eventos_copia == []
+        copia.agregar_historial(110, 1.75)
+        assert eventos_copia[0].anterior == calc.historial_imc[-1]['clasificacion']
+        print(" Intervalo mínimo y restauración")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Intervalo/restauración falló: {e}")
+    total_tests += 1
+    
+    # Test 4: Un suscriptor que falla no corta la ingesta ni a los demás
+    try:
+        calc = CalculadoraIMC()
+        eventos = []
+        
+        def falla(evento):
+            raise RuntimeError("suscriptor roto")
+        
+        calc.transiciones.suscribir(falla)
+        calc.transiciones.suscribir(eventos.append)
+        logging.disable(logging.CRITICAL)
+        try:
+            calc.agregar_historial(70, 1.75)
+            calc.agregar_historial(95, 1.75)
+            calc.encolar_calculo(70, 1.75)
+            calc.encolar_calculo(95, 1.75)
+            calc.encolar_calculo(70, 1.75)
+            calc.procesar_cola()
+        finally:
+            logging.disable(logging.NOTSET)
+        assert len(calc.historial_imc) == 5 and not calc.cola_imc
+        assert len(eventos) == 4 and len(calc.transiciones.errores) == 4
+        assert isinstance(calc.transiciones.errores[0][1], RuntimeError)
+        print(" Errores de suscriptores aislados")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Aislamiento de suscriptores falló: {e}")
+    total_tests += 1
+    
+    print(f"\n Transiciones: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def _leer_replica_en_proceso(nombre, resultados):
+    """Lector en otro proceso: consulta la réplica varias veces"""
+    replica = ReplicaLectura(nombre)
+    lecturas = []
+    for _ in range(20):
+        lecturas.append(replica.consultar('obtener_estadisticas'))
+    resultados.put([l['total_registros'] for l in lecturas if l])
+    replica.cerrar()
+
+def test_replicas():
+    """Pruebas de réplicas de solo lectura en memoria compartida"""
+    print("\n" + "="*60)
+    print("TEST RÉPLICAS")
+    print("="*60)
+    
+    tests_pasados = 0
+    total_tests = 0
+    
+    # Test 1: Lectura consistente con las consultas de la calculadora
+    try:
+        calc = CalculadoraGrasaCorporal()
+        for i in range(300):
+            calc.agregar_registro(20 + (i % 15), 20 + (i % 50), 'M' if i % 2 else 'F')
+        publicador = PublicadorMemoria(calc, capacidad=128)
+        publicador.sincronizar()
+        replica = ReplicaLectura(publicador.nombre)
+        assert replica.consultar('obtener_tendencia_grasa') == calc.obtener_tendencia_grasa()
+        assert len(replica.consultar('filtrar_por_sexo', 'M')) == 150
+        promedios = replica.consultar('obtener_promedio_por_edad')
+        assert all(abs(promedios[d] - v) < 1e-9 for d, v in calc.obtener_promedio_por_edad().items())
+        
+        calc.agregar_registro(30, 40, 'M')
+        publicador.sincronizar()
+        assert replica.consultar('obtener_tendencia_grasa')['total_registros'] == 301
+        replica.cerrar()
+        publicador.cerrar()
+        print(f" Réplica consistente (capacidad final {publicador.capacidad})")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Réplica consistente falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Reescritura del historial (limpieza)
+    try:
+        calc = CalculadoraIMC()
+        for i in range(50):
+            calc.agregar_historial(60 + i, 1.75)
+        publicador = PublicadorMemoria(calc)
+        publicador.sincronizar()
+        replica = ReplicaLectura(publicador.nombre)
+        calc.limpiar_historial(confirmacion=True)
+        calc.agregar_historial(70, 1.75)
+        publicador.sincronizar()
+        estadisticas = replica.consultar('obtener_estadisticas')
+        assert estadisticas['total_registros'] == 1
+        assert estadisticas['imc_promedio'] == calc.obtener_estadisticas()['imc_promedio']
+        replica.cerrar()
+        publicador.cerrar()
+        print(" Reescritura detectada por la réplica")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Reescritura falló: {e}")
+    total_tests += 1
+    
+    # Test 3: Lector en otro proceso mientras el escritor procesa la cola
+    try:
+        calc = CalculadoraIMC()
+        calc.agregar_historial(70, 1.75)
+        publicador = PublicadorMemoria(calc, capacidad=4096)
+        publicador.sincronizar()
+        resultados = multiprocessing.Queue()
+        lector = multiprocessing.Process(target=_leer_replica_en_proceso, args=(publicador.nombre, resultados))
+        lector.start()
+        for lote in range(20):
+            for i in range(50):
+                calc.encolar_calculo(60 + i, 1.75)
+            calc.procesar_cola()
+            publicador.sincronizar()
+        totales = resultados.get(timeout=30)
+        lector.join(timeout=30)
+        assert lector.exitcode == 0
+        assert totales == sorted(totales) and all(t % 50 == 1 for t in totales)
+        publicador.cerrar()
+        print(f" Lector en otro proceso: {len(totales)} lecturas consistentes")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Lector en otro proceso falló: {e}")
+    total_tests += 1
+    
+    # Test 4: Varias reubicaciones con nombre fijo y resúmenes replicados
+    try:
+        calc = CalculadoraGrasaCorporal()
+        calc.agregar_registro(25, 30, 'M')
+        nombre = f"hbh_prueba_{multiprocessing.current_process().pid}"
+        publicador = PublicadorMemoria(calc, capacidad=4, nombre=nombre)
+        publicador.sincronizar()
+        atrasada = ReplicaLectura(nombre)
+        assert atrasada.consultar('obtener_tendencia_grasa') == calc.obtener_tendencia_grasa()
+        for i in range(40):  # Dos o más reubicaciones sin que la réplica lea
+            calc.agregar_registro(20 + (i % 15), 20 + i, 'M' if i % 2 else 'F')
+            publicador.sincronizar()
+        assert publicador.nombre == nombre and publicador.capacidad >= 41
+        assert atrasada.consultar('obtener_tendencia_grasa')['total_registros'] == 41
+        nueva = ReplicaLectura(nombre)
+        assert nueva.consultar('obtener_percentiles') == calc.obtener_percentiles()
+        assert nueva.consultar('obtener_histograma', 'imc') == calc.obtener_histograma('imc')
+        atrasada.cerrar()
+        nueva.cerrar()
+        publicador.cerrar()
+        print(f" Reubicaciones con nombre fijo (capacidad final {publicador.capacidad})")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Reubicaciones con nombre fijo fallaron: {e}")
+    total_tests += 1
+    
+    # Test 5: Enteros conservados, publicación fallida y escritor detenido
+    try:
+        calc = CalculadoraGrasaCorporal()
+        calc.agregar_registro(25, 30, 'M')
+        calc.agregar_registro(26.5, 31.5, 'F')
+        publicador = PublicadorMemoria(calc)
+        publicador.sincronizar()
+        replica = ReplicaLectura(publicador.nombre, espera_maxima=0.2)
+        tipos = replica.leer(lambda c: [(type(r['edad']), type(r['imc'])) for r in c.registros_grasa])
+        assert tipos == [(int, int), (float, float)]
+        assert replica.consultar('obtener_promedio_por_edad') == calc.obtener_promedio_por_edad()
+        # Si los resúmenes no entran, la secuencia queda par y la réplica sigue leyendo
+        tamano_resumenes = replicas.TAMANO_RESUMENES
+        replicas.TAMANO_RESUMENES = 16
+        calc.agregar_registro(27, 40, 'M')
+        try:
+            publicador.sincronizar()
+            assert False, "Los resúmenes no deberían entrar"
+        except ValueError:
+            pass
+        finally:
+            replicas.TAMANO_RESUMENES = tamano_resumenes
+        assert replica.consultar('obtener_tendencia_grasa')['total_registros'] == 2
+        assert publicador.sincronizar() == 3
+        assert replica.consultar('obtener_tendencia_grasa')['total_registros'] == 3
+        # Un escritor que muere a mitad de una escritura no bloquea a los lectores
+        secuencia = struct.unpack_from('<Q', publicador._segmento.buf, 4)[0]
+        struct.pack_into('<Q', publicador._segmento.buf, 4, secuencia + 1)
+        try:
+            replica.consultar('obtener_tendencia_grasa')
+            assert False, "Debería agotar la espera"
+        except TimeoutError:
+            pass
+        replica.cerrar()
+        publicador.cerrar()
+        print(" Enteros conservados y esperas acotadas")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Enteros y esperas acotadas fallaron: {e}")
+    total_tests += 1
+    
+    print(f"\n Réplicas: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
+def test_resistencia():
+    """Prueba corta del arnés de resistencia"""
+    print("\n" + "="*60)
+    print("TEST RESISTENCIA")
+    print("="*60)
+    
+    tests_pasados = 0
+    total_tests = 0
+    
+    # Test 1: Ejecución corta dentro de presupuestos holgados
+    try:
+        configuracion = ConfiguracionResistencia(duracion_s=2, tasa_por_segundo=500, intervalo_muestreo_s=0.5,
+                                                 crecimiento_memoria_max_mb_min=1000,
+                                                 pendiente_p99_max_ms_min=1000, semilla=3)
+        resultado = ejecutar(configuracion)
+        assert resultado.aprobado, resultado.fallas
+        assert len(resultado.muestras) >= 4
+        assert resultado.operaciones > 500
+        ultima = resultado.muestras[-1]
+        assert ultima['rss_mb'] > 0 and ultima['top_asignaciones_kb']
+        print(f" {resultado.operaciones} operaciones, p99 final {ultima['p99_ms']:.3f} ms, "
+              f"memoria {resultado.crecimiento_memoria_mb_min:.2f} MB/min")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Ejecución de resistencia falló: {e}")
+    total_tests += 1
+    
+    # Test 2: Los presupuestos excedidos se reportan como fallas
+    try:
+        configuracion = ConfiguracionResistencia(duracion_s=1, tasa_por_segundo=1000, intervalo_muestreo_s=0.25,
+                                                 mezcla={'imc_agregar': 1, 'imc_estadisticas': 1},
+                                                 usar_tracemalloc=False, crecimiento_memoria_max_mb_min=-1e9,
+                                                 pendiente_p99_max_ms_min=-1e9, semilla=4)
+        resultado = ejecutar(configuracion)
+        assert not resultado.aprobado and len(resultado.fallas) == 2
+        print(f" Fallas detectadas: {len(resultado.fallas)}")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Detección de fallas falló: {e}")
+    total_tests += 1
+    
+    # Test 3: El modelo de retención recorta historiales sin perder trabajo encolado
+    try:
+        assert ConfiguracionResistencia().maximo_registros is None  # Sin retención por defecto
+        operaciones = _crear_operaciones(random.Random(5), maximo_registros=50)
+        tamanos = []
+        for _ in range(300):
+            operaciones['imc_agregar']()
+            tamanos.append(operaciones['imc_estadisticas']()['total_registros'])
+        assert tamanos[:50] == list(range(1, 51)) and set(tamanos[50:]) == {50}
+        operaciones = _crear_operaciones(random.Random(6), maximo_registros=3)
+        for _ in range(5):
+            operaciones['grasa_encolar']()
+        operaciones['grasa_procesar']()
+        assert operaciones['grasa_tendencia']()['total_registros'] == 3
+        print(f" Historial recortado a {max(tamanos)} registros")
+        tests_pasados += 1
+    except Exception as e:
+        print(f" Retención de historial falló: {e}")
+    total_tests += 1
+    
+    print(f"\n Resistencia: {tests_pasados}/{total_tests} pruebas exitosas")
+    return tests_pasados, total_tests
+
 def test_rendimiento():
     """Pruebas de rendimiento"""
     print("\n" + "="*60)
@@ -379,6 +1052,13 @@ def main():
     resultados.append(test_calculadora_grasa_corporal())
     resultados.append(test_calculadora_masa_muscular())
     resultados.append(test_integracion_completa())
+    resultados.append(test_agrupacion())
+    resultados.append(test_resumenes())
+    resultados.append(test_escenarios())
+    resultados.append(test_instantaneas())
+    resultados.append(test_transiciones())
+    resultados.append(test_replicas())
+    resultados.append(test_resistencia())
     resultados.append(test_rendimiento())
     
     # Calcular totales